@@ -8,6 +8,8 @@ from datetime import datetime
 from typing import Dict, Any, List, Optional, Union
 from enum import Enum
 from datetime import datetime
+from collections import OrderedDict
+import threading
 import uuid
 
 from utils.logging_config import get_logger
@@ -60,6 +62,42 @@ class AgentRegistry:
 # Instancia global del registro
 agent_registry = AgentRegistry()
 
+class ImageBlobStore:
+    """
+    Imágenes subidas referenciadas por id.
+    
+    El contexto de los agentes solo guarda la referencia, así los bytes no se copian
+    en cada checkpoint del estado. Cada interfaz libera las referencias que deja de
+    usar; max_items es solo un tope de seguridad para el proceso.
+    """
+    
+    def __init__(self, max_items: int = 100):
+        self.max_items = max_items
+        self._blobs: "OrderedDict[str, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def put(self, data: bytes) -> str:
+        """Guarda una imagen y retorna su referencia"""
+        blob_id = uuid.uuid4().hex
+        with self._lock:
+            self._blobs[blob_id] = data
+            while len(self._blobs) > self.max_items:
+                self._blobs.popitem(last=False)
+        return blob_id
+    
+    def get(self, blob_id: str) -> Optional[bytes]:
+        """Obtiene una imagen por referencia (None si ya fue liberada)"""
+        with self._lock:
+            return self._blobs.get(blob_id)
+    
+    def discard(self, blob_id: str):
+        """Libera una imagen"""
+        with self._lock:
+            self._blobs.pop(blob_id, None)
+
+# Instancia global del almacén de imágenes
+image_store = ImageBlobStore()
+
 class BaseAgent:
     """Clase base para todos los agentes del sistema"""
     
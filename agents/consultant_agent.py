@@ -111,7 +111,7 @@ class ConsultantAgent(BaseAgent):
             
             # Verificar si es un saludo básico o conversación corta
             if self._is_basic_greeting(state.last_user_input) or len(state.last_user_input.split()) <= 2:
-                response = self._get_conversational_response(state.last_user_input, state)
+                response = await self._get_conversational_response(state.last_user_input, state)
                 state = self.update_state(state, agent_response=response["content"])
                 state = self.add_message_to_history(state, "assistant", response["content"])
                 return state
@@ -124,7 +124,7 @@ class ConsultantAgent(BaseAgent):
                 return state
             
             # Realizar consulta RAG
-            rag_result = self.rag_service.query(
+            rag_result = await self.rag_service.aquery(
                 question=state.last_user_input,
                 include_sources=True
             )
@@ -407,7 +407,7 @@ class ConsultantAgent(BaseAgent):
         
         return False
     
-    def _get_conversational_response(self, user_input: str, state: AgentState) -> Dict[str, Any]:
+    async def _get_conversational_response(self, user_input: str, state: AgentState) -> Dict[str, Any]:
         """Genera respuesta conversacional inteligente usando LLM"""
         user_input_lower = user_input.lower().strip()
         
@@ -433,7 +433,7 @@ class ConsultantAgent(BaseAgent):
             Respuesta (máximo 100 palabras):
             """
             
-            llm_response = self.rag_service.llm.invoke(prompt)
+            llm_response = await self.rag_service.llm.ainvoke(prompt)
             content = llm_response.content.strip()
             
             return {
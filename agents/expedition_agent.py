@@ -3,6 +3,7 @@ Agente de Expedición - Especializado en la emisión de pólizas.
 Maneja recolección de datos del cliente y expedición usando la API existente.
 """
 
+import asyncio
 import re
 from typing import Dict, Any, List, Optional
 
@@ -303,7 +304,8 @@ class ExpeditionAgent(BaseAgent):
                 return state
         
         # Parsear datos del cliente y combinar con datos parciales
-        client_data = self._parse_client_data(user_input)
+        # Puede llamar al LLM de forma síncrona: fuera del event loop
+        client_data = await asyncio.to_thread(self._parse_client_data, user_input)
         
         # ACUMULACIÓN CRÍTICA: Combinar con datos parciales existentes
         partial_data = state.context_data.get("partial_client_data", {})
@@ -77,7 +77,7 @@ class IntentClassifier:
             }
         }
 
-    def classify_intent(self, user_input: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    async def classify_intent(self, user_input: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """
         Clasifica la intención del usuario usando LLM
         
@@ -93,7 +93,7 @@ class IntentClassifier:
             classification_prompt = self._build_classification_prompt(user_input, context)
             
             # Ejecutar clasificación con LLM
-            response = self.llm.invoke(classification_prompt)
+            response = await self.llm.ainvoke(classification_prompt)
             
             # Procesar respuesta
             return self._process_classification_response(response.content, user_input, context)
@@ -3,7 +3,7 @@ Orquestador Principal - Coordina todos los agentes usando LangGraph.
 Implementa el flujo de conversación multiagéntico y gestión de estado.
 """
 
-from typing import Dict, Any, List, Optional, Union
+from typing import Dict, Any, List, Optional, Union, AsyncIterator
 from datetime import datetime
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
@@ -20,6 +20,10 @@ from utils.logging_config import get_logger
 
 logger = get_logger("orchestrator")
 
+# Nodos cuyos tokens del LLM se reenvían al cliente en streaming
+# (el router solo clasifica intención y su salida no es para el usuario)
+STREAMED_NODES = frozenset({"consultant"})
+
 class AgentOrchestrator:
     """Orquestador principal del sistema multiagéntico"""
     
@@ -152,60 +156,109 @@ class AgentOrchestrator:
             Respuesta procesada del sistema
         """
         try:
-            self.logger.info("Procesando entrada del usuario", 
-                           session_id=session_id,
-                           user_type=user_type,
-                           input_length=len(user_input))
-            
-            # Crear o recuperar estado
-            state = await self._get_or_create_state(session_id, user_type, context_data or {})
-            
-            # Actualizar con nueva entrada del usuario
-            state.last_user_input = user_input
-            state = self._add_user_message_to_history(state, user_input)
-            
-            # Configuración para LangGraph
-            config = {
-                "configurable": {
-                    "thread_id": session_id,
-                    "checkpoint_ns": f"session_{session_id}"
-                }
-            }
+            state, config = await self._prepare_invocation(session_id, user_input, user_type, context_data)
             
             # Ejecutar workflow
             result = await self.app.ainvoke(state, config=config)
             
-            # Preparar respuesta
-            response = self._format_orchestrator_response(result)
+            return self._finalize_response(session_id, result)
             
-            # Obtener agente final del resultado (puede ser dict o AgentState)
-            final_agent = result.get("current_agent") if isinstance(result, dict) else result.current_agent
+        except Exception as e:
+            self.logger.error(f"Error procesando entrada del usuario: {str(e)}")
+            return self._error_response(session_id, e)
+    
+    async def stream_user_input(self, session_id: str, user_input: str,
+                                user_type: str = "client",
+                                context_data: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Variante en streaming de process_user_input
+        
+        Emite eventos {"type": "token", "content": delta} con los tokens del LLM de
+        los nodos en STREAMED_NODES a medida que llegan, y termina siempre con un
+        único {"type": "final", "response": ...} con la misma forma que
+        process_user_input.
+        """
+        try:
+            state, config = await self._prepare_invocation(session_id, user_input, user_type, context_data)
             
-            self.logger.info("Entrada procesada exitosamente",
-                           session_id=session_id,
-                           final_agent=final_agent,
-                           response_type=response.get("type"))
+            result = None
+            async for event in self.app.astream_events(state, config=config, version="v2"):
+                kind = event["event"]
+                
+                if kind == "on_chat_model_stream":
+                    if event.get("metadata", {}).get("langgraph_node") in STREAMED_NODES:
+                        delta = event["data"]["chunk"].content
+                        if delta:
+                            yield {"type": "token", "content": delta}
+                
+                elif kind == "on_chain_end" and not event.get("parent_ids"):
+                    # Fin del grafo raíz: su salida es el estado final
+                    result = event["data"].get("output")
             
-            return response
+            response = self._finalize_response(session_id, result)
             
         except Exception as e:
-            self.logger.error(f"Error procesando entrada del usuario: {str(e)}")
-            
-            # Respuesta de error fallback MÁS orientativa
-            return {
-                "success": False,
-                "content": (
-                    "😅 **¡Ups! Algo salió mal momentáneamente.**\n\n"
-                    "🔄 **Puedes intentar:**\n"
-                    "• Reformular tu consulta de manera más simple\n"
-                    "• Si buscas cotización: 'Quiero cotizar mi Toyota 2020'\n"
-                    "• Si tienes preguntas: 'Cuáles son los planes disponibles'\n\n"
-                    "🤝 **¿Necesitas ayuda inmediata?** Escribe 'hablar con asesor' y te conectaré con un humano."
-                ),
-                "type": "error",
-                "session_id": session_id,
-                "error": str(e)
+            self.logger.error(f"Error procesando entrada del usuario en streaming: {str(e)}")
+            response = self._error_response(session_id, e)
+        
+        yield {"type": "final", "response": response}
+    
+    async def _prepare_invocation(self, session_id: str, user_input: str, user_type: str,
+                                  context_data: Optional[Dict[str, Any]]):
+        """Prepara estado y configuración de LangGraph para una entrada del usuario"""
+        self.logger.info("Procesando entrada del usuario", 
+                       session_id=session_id,
+                       user_type=user_type,
+                       input_length=len(user_input))
+        
+        # Crear o recuperar estado
+        state = await self._get_or_create_state(session_id, user_type, context_data or {})
+        
+        # Actualizar con nueva entrada del usuario
+        state.last_user_input = user_input
+        state = self._add_user_message_to_history(state, user_input)
+        
+        # Configuración para LangGraph
+        config = {
+            "configurable": {
+                "thread_id": session_id,
+                "checkpoint_ns": f"session_{session_id}"
             }
+        }
+        
+        return state, config
+    
+    def _finalize_response(self, session_id: str, result: Union[AgentState, Dict[str, Any]]) -> Dict[str, Any]:
+        """Formatea el resultado del workflow y registra el agente final"""
+        # Preparar respuesta
+        response = self._format_orchestrator_response(result)
+        
+        # Obtener agente final del resultado (puede ser dict o AgentState)
+        final_agent = result.get("current_agent") if isinstance(result, dict) else result.current_agent
+        
+        self.logger.info("Entrada procesada exitosamente",
+                       session_id=session_id,
+                       final_agent=final_agent,
+                       response_type=response.get("type"))
+        
+        return response
+    
+    def _error_response(self, session_id: str, error: Exception) -> Dict[str, Any]:
+        """Respuesta de error fallback MÁS orientativa"""
+        return {
+            "success": False,
+            "content": (
+                "😅 **¡Ups! Algo salió mal momentáneamente.**\n\n"
+                "🔄 **Puedes intentar:**\n"
+                "• Reformular tu consulta de manera más simple\n"
+                "• Si buscas cotización: 'Quiero cotizar mi Toyota 2020'\n"
+                "• Si tienes preguntas: 'Cuáles son los planes disponibles'\n\n"
+                "🤝 **¿Necesitas ayuda inmediata?** Escribe 'hablar con asesor' y te conectaré con un humano."
+            ),
+            "type": "error",
+            "session_id": session_id,
+            "error": str(error)
+        }
     
     async def _get_or_create_state(self, session_id: str, user_type: str, 
                                   context_data: Dict[str, Any]) -> AgentState:
@@ -325,7 +378,7 @@ class AgentOrchestrator:
         
         return None  # No hay flujo activo
     
-    def _determine_next_agent(self, state: AgentState) -> str:
+    async def _determine_next_agent(self, state: AgentState) -> str:
         """Determina el próximo agente a ejecutar"""
         
         # Verificar escalamiento humano primero
@@ -349,7 +402,7 @@ class AgentOrchestrator:
         try:
             self.logger.debug("Ejecutando routing INTELIGENTE con LLM")
             
-            classification = intent_classifier.classify_intent(
+            classification = await intent_classifier.classify_intent(
                 user_input=state.last_user_input,
                 context=state.context_data
             )
@@ -659,6 +712,8 @@ class AgentOrchestrator:
                 "updated_at": session.updated_at.isoformat(),
                 "message_count": len(recent_history),
                 "agent_states": agent_states,
+                # Solo el agente de escalamiento marca escalation_executed en su estado
+                "escalated": any(state.get("escalation_executed") for state in agent_states.values()),
                 "last_messages": [
                     {
                         "agent": msg.agent_type,
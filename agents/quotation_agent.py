@@ -3,21 +3,61 @@ Agente de Cotización - Especializado en generar cotizaciones multimodales.
 Maneja análisis de imágenes de vehículos y generación de cotizaciones.
 """
 
+import asyncio
+import atexit
 import base64
+import importlib.util
+import re
+from collections import defaultdict
 from typing import Dict, Any, List, Optional
 from io import BytesIO
 from PIL import Image
 
-from agents.base_agent import BaseAgent, AgentState, AgentCapabilities
+import httpx
+from openai import AzureOpenAI
+
+from agents.base_agent import BaseAgent, AgentState, AgentCapabilities, image_store
 from services.quotation_service import quotation_service
 from utils.config import config
 
+# Valores que el LLM devuelve cuando no identifica un campo
+INVALID_VALUES = frozenset({"n/a", "no", "ninguno", "desconocido"})
+
+# Campos del esquema fijo de extracción de vehículo
+FIELD_RE = re.compile(r'"(marca|modelo|linea|clase|color)"\s*:\s*"([^"]*)"')
+
+# Plantilla de respuesta para vehículos fuera del catálogo
+NOT_INSURABLE_TMPL = (
+    "Lo siento, pero según nuestro catálogo actual, el vehículo "
+    "{marca} {modelo} {linea} no está disponible para asegurar "
+    "en este momento.\n\n"
+    "Te voy a conectar con un asesor especializado que puede:\n"
+    "• Verificar si hay alternativas disponibles\n"
+    "• Revisar si hay actualizaciones en nuestro catálogo\n"
+    "• Ofrecerte opciones para vehículos similares"
+)
+
 class QuotationAgent(BaseAgent):
     """Agente especializado en cotizaciones multimodales"""
     
     def __init__(self):
         super().__init__("quotation")
         self.quotation_service = quotation_service
+        self._model = config.azure_openai.chat_deployment
+        
+        # Cliente HTTP compartido: reutiliza conexiones TLS entre llamadas al LLM
+        self._http = httpx.Client(
+            http2=importlib.util.find_spec("h2") is not None,
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=50)
+        )
+        atexit.register(self._http.close)
+        self.llm_client = AzureOpenAI(
+            api_key=config.azure_openai.api_key,
+            api_version=config.azure_openai.api_version,
+            azure_endpoint=config.azure_openai.endpoint,
+            http_client=self._http
+        )
         
         self.quotation_keywords = [
             "quiero cotizar", "necesito cotización", "cotizar mi", 
@@ -123,7 +163,8 @@ class QuotationAgent(BaseAgent):
         try:
             # Obtener estado específico de cotización
             quotation_state = state.context_data.get("quotation_state", "")
-            image_data = state.context_data.get("image_data")
+            image_ref = state.context_data.get("image_ref")
+            image_data = image_store.get(image_ref) if image_ref else state.context_data.get("image_data")
             
             self.logger.info("Procesando cotización", 
                            quotation_state=quotation_state,
@@ -146,7 +187,10 @@ class QuotationAgent(BaseAgent):
                     if state.context_data.get("current_quotation"):
                         # Ya tenemos cotización, pasar a quote_ready
                         state.context_data["quotation_state"] = self.STATES["QUOTE_READY"]
-                        response = self._format_quotation_response(state.context_data["current_quotation"])
+                        response = self._format_quotation_response(
+                            state.context_data["current_quotation"],
+                            quotation_id=state.context_data.get("quotation_id")
+                        )
                         state = self.update_state(state, agent_response=response["content"])
                         state = self.add_message_to_history(state, "assistant", response["content"])
                         return state
@@ -349,17 +393,10 @@ RESPONDE EN JSON:
 }}
 """
 
-            from openai import AzureOpenAI
-            from utils.config import config
-            
-            client = AzureOpenAI(
-                api_key=config.azure_openai.api_key,
-                api_version=config.azure_openai.api_version,
-                azure_endpoint=config.azure_openai.endpoint
-            )
-            
-            response = client.chat.completions.create(
-                model=config.azure_openai.chat_deployment,
+            # Cliente síncrono: en un hilo para no bloquear el event loop compartido
+            response = await asyncio.to_thread(
+                self.llm_client.chat.completions.create,
+                model=self._model,
                 messages=[{"role": "user", "content": context}],
                 temperature=0.3,
                 max_tokens=500
@@ -535,7 +572,8 @@ RESPONDE EN JSON:
             ])
             
             # Parsear entrada del usuario para extraer detalles
-            details = self._parse_vehicle_details(state.last_user_input, vehicle_analysis)
+            # Puede llamar al LLM de forma síncrona: fuera del event loop
+            details = await asyncio.to_thread(self._parse_vehicle_details, state.last_user_input, vehicle_analysis)
             
             # Contar cuántas veces hemos pedido información
             attempt_count = state.context_data.get("detail_request_attempts", 0)
@@ -888,7 +926,7 @@ RESPONDE EN JSON:
             state.context_data["quotation_id"] = quotation_id
             
             # Formatear respuesta
-            response = self._format_quotation_response(quotation_result)
+            response = self._format_quotation_response(quotation_result, quotation_id=quotation_id)
             
             state = self.update_state(state, agent_response=response["content"])
             state = self.add_message_to_history(
@@ -1208,16 +1246,7 @@ RESPONDE EN JSON:
     
     def _vehicle_not_insurable_response(self, vehicle_details: Dict) -> Dict[str, Any]:
         """Respuesta cuando el vehículo no es asegurable"""
-        response = (
-            f"Lo siento, pero según nuestro catálogo actual, el vehículo "
-            f"{vehicle_details.get('marca', '')} {vehicle_details.get('modelo', '')} "
-            f"{vehicle_details.get('linea', '')} no está disponible para asegurar "
-            f"en este momento.\n\n"
-            f"Te voy a conectar con un asesor especializado que puede:\n"
-            f"• Verificar si hay alternativas disponibles\n"
-            f"• Revisar si hay actualizaciones en nuestro catálogo\n"
-            f"• Ofrecerte opciones para vehículos similares"
-        )
+        response = NOT_INSURABLE_TMPL.format_map(defaultdict(str, vehicle_details))
         
         return self.format_response(
             content=response,
@@ -1225,11 +1254,22 @@ RESPONDE EN JSON:
             metadata={"vehicle_details": vehicle_details}
         )
     
-    def _format_quotation_response(self, quotation_result: Dict) -> Dict[str, Any]:
-        """Formatea la respuesta de cotización para el usuario"""
+    def _format_quotation_response(self, quotation_result: Dict,
+                                   quotation_id: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Formatea la respuesta de cotización para el usuario
+        
+        La metadata solo referencia la cotización por quotation_id; el resultado
+        completo ya está persistido en la tabla quotations (ver db_manager.get_quotation).
+        """
         vehicle_info = quotation_result["vehicle_info"]
         quotations = quotation_result["quotations"]
         
+        if len(quotations) == 1:
+            return self._format_single_plan(
+                vehicle_info, next(iter(quotations.items())), quotation_result, quotation_id
+            )
+        
         response_parts = [
             f"🚗 **Cotización para tu {vehicle_info['marca']} {vehicle_info['modelo']}**",
             f"Línea: {vehicle_info['linea']}",
@@ -1265,8 +1305,39 @@ RESPONDE EN JSON:
             content="\n".join(response_parts),
             response_type="quotation_result",
             metadata={
-                "quotation_data": quotation_result,
-                "plans_count": len(quotations)
+                "quotation_id": quotation_id,
+                "plans_count": len(quotations),
+                "vehicle": vehicle_info
+            }
+        )
+    
+    def _format_single_plan(self, vehicle_info: Dict, plan: tuple, quotation_result: Dict,
+                            quotation_id: Optional[str] = None) -> Dict[str, Any]:
+        """Formatea la respuesta cuando la cotización tiene un único plan"""
+        plan_name, plan_data = plan
+        surcharge = (
+            "*Se aplicó recargo del 10% por color rojo*\n\n"
+            if quotation_result.get("color_surcharge_applied") else ""
+        )
+        
+        content = (
+            f"🚗 **{plan_name} para tu {vehicle_info['marca']} {vehicle_info['modelo']}**\n"
+            f"Línea: {vehicle_info['linea']}\n"
+            f"Clase: {vehicle_info['clase']} | Color: {vehicle_info['color']}\n\n"
+            f"{surcharge}"
+            f"• Prima anual: ${plan_data['prima_anual']:,.0f}\n"
+            f"• Prima mensual: ${plan_data['prima_mensual']:,.0f}\n\n"
+            f"¿Deseas proceder con la expedición de tu póliza con este plan? "
+            f"También puedes solicitar hablar con un asesor para aclarar cualquier duda."
+        )
+        
+        return self.format_response(
+            content=content,
+            response_type="quotation_result",
+            metadata={
+                "quotation_id": quotation_id,
+                "plans_count": 1,
+                "vehicle": vehicle_info
             }
         )
     
@@ -1286,40 +1357,40 @@ RESPONDE EN JSON:
     def _extract_vehicle_info_with_llm(self, user_input: str) -> Dict[str, str]:
         """Extrae información del vehículo usando LLM para entender texto libre"""
         try:
-            system_prompt = """Eres un experto en extraer información de vehículos. 
-Tu tarea es identificar marca, modelo/año, línea, clase y color de la descripción del usuario.
-
-IMPORTANTE:
-- Devuelve SOLO los campos que puedas identificar con certeza
-- Para marca: Toyota, Chevrolet, Renault, Ford, Nissan, Hyundai, etc.
-- Para modelo: solo el año (ej: 2020, 2018, 2019)
-- Para clase: Automóvil, Camioneta, Motocicleta
-- Para línea: nombre específico del modelo (Corolla, Sandero, Onix, etc.)
-- Para color: Blanco, Negro, Gris, Rojo, etc.
-
-Responde en formato JSON simple:
-{"marca": "...", "modelo": "...", "linea": "...", "clase": "...", "color": "..."}"""
+            system_prompt = (
+                'Extrae marca, modelo (año), linea, clase, color. '
+                'JSON: {"marca":"","modelo":"","linea":"","clase":"","color":""}. '
+                'Omite campos desconocidos.'
+            )
 
             user_prompt = f"Extrae información del vehículo de: '{user_input}'"
             
             response = self.llm_client.chat.completions.create(
-                model=config.azure_openai_model,
+                model=self._model,
                 messages=[
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
                 temperature=0.1,
-                max_tokens=200
+                max_tokens=80,
+                response_format={"type": "json_object"}
             )
             
-            import json
-            result = json.loads(response.choices[0].message.content)
+            content = response.choices[0].message.content
+            
+            # Esquema conocido: extracción directa, JSON solo como respaldo
+            result = dict(FIELD_RE.findall(content))
+            if not result:
+                import json
+                result = json.loads(content)
             
             # Filtrar campos vacíos o inválidos
-            filtered_result = {}
-            for key, value in result.items():
-                if value and value.strip() and value.lower() not in ["n/a", "no", "ninguno", "desconocido"]:
-                    filtered_result[key] = value.strip()
+            filtered_result = {
+                key: cleaned for key, value in result.items()
+                if isinstance(value, str)
+                and (cleaned := value.strip())
+                and cleaned.casefold() not in INVALID_VALUES
+            }
             
             self.logger.info(f"✅ LLM extrajo: {filtered_result} de '{user_input}'")
             return filtered_result
@@ -4,11 +4,47 @@ Script de instalación inteligente para resolver problemas de dependencias.
 Maneja incompatibilidades comunes y ofrece alternativas.
 """
 
-import subprocess
 import sys
 import os
+import shutil
+import threading
+from collections import deque
+from importlib import metadata
 from pathlib import Path
 
+# Lista de paquetes críticos con alternativas
+CRITICAL_PACKAGES = [
+    # Core Streamlit (más importante)
+    ("streamlit>=1.37.0,<2.0.0", "streamlit==1.37.0", "Streamlit (interfaz principal)"),
+    
+    # Procesamiento de datos (versión validada)
+    ("pandas>=2.2.0,<2.3.0", "pandas==2.2.3", "Pandas (manejo de datos)"),
+    
+    # Imágenes y vision
+    ("pillow>=10.0.0", "pillow==10.2.0", "Pillow (procesamiento imágenes)"),
+    ("requests>=2.31.0", "requests==2.31.0", "Requests (APIs)"),
+    
+    # APIs web
+    ("flask>=3.1.0,<4.0.0", "flask==3.1.2", "Flask (API expedición)"),
+    
+    # Base de datos
+    ("sqlalchemy>=2.0.0,<3.0.0", "sqlalchemy==2.0.23", "SQLAlchemy (base de datos)"),
+    ("openpyxl>=3.1.0", "openpyxl==3.1.2", "OpenPyXL (archivos Excel)"),
+]
+
+# Paquetes opcionales (para funcionalidad completa)
+OPTIONAL_PACKAGES = [
+    ("langchain>=0.3.0,<0.4.0", "langchain==0.3.27", "LangChain (agentes IA)"),
+    ("langchain-openai>=0.3.0,<0.4.0", "langchain-openai==0.3.32", "LangChain OpenAI"),
+    ("openai>=1.100.0,<2.0.0", "openai==1.107.0", "OpenAI Python client"),
+    ("chromadb>=1.0.0,<2.0.0", "chromadb==1.0.20", "ChromaDB (vector store)"),
+    ("sentence-transformers>=2.2.0", None, "Sentence Transformers (embeddings)"),
+    ("ciso8601>=2.3.0", None, "ciso8601 (fechas ISO rápidas en la UI)"),
+    ("orjson>=3.9.0", None, "orjson (metadata de mensajes)"),
+    ("waitress>=3.0.0", None, "Waitress (servidor WSGI de la API de expedición)"),
+    ("pyarrow>=14.0.0", None, "PyArrow (cache parquet del catálogo de cotización)"),
+]
+
 def check_python_version():
     """Verifica versión de Python"""
     version = sys.version_info
@@ -24,31 +60,86 @@ def check_python_version():
         print("❌ Python 3.9+ requerido")
         sys.exit(1)
 
+def is_package_installed(package_spec):
+    """Indica si ya hay instalada una versión que satisface el requerimiento"""
+    try:
+        from packaging.requirements import Requirement
+        from packaging.version import Version
+    except ImportError:
+        return False
+    
+    req = Requirement(package_spec)
+    try:
+        installed = Version(metadata.version(req.name))
+    except metadata.PackageNotFoundError:
+        return False
+    
+    return req.specifier.contains(installed, prereleases=True)
+
+def pip_install_command(package_spec):
+    """Construye el comando de instalación, usando uv si está disponible"""
+    uv = shutil.which("uv")
+    if uv:
+        # Apuntar al mismo intérprete que ejecuta este script
+        return [uv, "pip", "install", "--python", sys.executable, package_spec]
+    return [sys.executable, "-m", "pip", "install", package_spec]
+
+def run_pip_install(package_spec, timeout=300):
+    """Ejecuta pip install conservando solo las últimas líneas de stderr"""
+    import subprocess
+    
+    proc = subprocess.Popen(
+        pip_install_command(package_spec),
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    tail = deque(maxlen=10)
+    
+    # Drenar stderr en un hilo (memoria acotada); readline puede bloquearse mientras
+    # pip descarga sin escribir nada, así que el timeout lo impone wait() aquí
+    drain = threading.Thread(
+        target=lambda: tail.extend(iter(proc.stderr.readline, "")), daemon=True
+    )
+    drain.start()
+    
+    try:
+        returncode = proc.wait(timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+        raise
+    finally:
+        drain.join(timeout=5)
+        proc.stderr.close()
+    
+    return returncode, "".join(tail)
+
 def install_package_safely(package_spec, fallback_spec=None, description=""):
     """Instala un paquete con fallback en caso de error"""
+    import subprocess
+    
+    if is_package_installed(package_spec):
+        print(f"✅ {package_spec} ya instalado")
+        return True
+    
     print(f"\n📦 Instalando {description or package_spec}...")
     
     try:
         # Intentar instalación principal
-        result = subprocess.run([
-            sys.executable, "-m", "pip", "install", package_spec
-        ], capture_output=True, text=True, timeout=300)
+        returncode, error_tail = run_pip_install(package_spec)
         
-        if result.returncode == 0:
+        if returncode == 0:
             print(f"✅ {package_spec} instalado exitosamente")
             return True
         else:
-            print(f"⚠️  Error instalando {package_spec}: {result.stderr[:200]}")
+            print(f"⚠️  Error instalando {package_spec}: {error_tail}")
             
             # Intentar fallback si existe
             if fallback_spec:
                 print(f"🔄 Intentando versión alternativa: {fallback_spec}")
                 
-                result = subprocess.run([
-                    sys.executable, "-m", "pip", "install", fallback_spec
-                ], capture_output=True, text=True, timeout=300)
+                returncode, error_tail = run_pip_install(fallback_spec)
                 
-                if result.returncode == 0:
+                if returncode == 0:
                     print(f"✅ {fallback_spec} instalado exitosamente")
                     return True
                 else:
@@ -63,8 +154,31 @@ def install_package_safely(package_spec, fallback_spec=None, description=""):
         print(f"❌ Error inesperado: {e}")
         return False
 
+def check_installed():
+    """Verifica versiones instaladas sin invocar pip"""
+    print("🔍 Verificando paquetes instalados...")
+    check_python_version()
+    
+    missing = [
+        package_spec
+        for package_spec, _, _ in CRITICAL_PACKAGES + OPTIONAL_PACKAGES
+        if not is_package_installed(package_spec)
+    ]
+    
+    for package_spec in missing:
+        print(f"❌ {package_spec} no satisfecho")
+    
+    if missing:
+        print(f"\n⚠️  {len(missing)} paquetes pendientes. Ejecuta: python install_dependencies.py")
+        return False
+    
+    print("✅ Todos los paquetes ya están instalados")
+    return True
+
 def main():
     """Función principal de instalación"""
+    import subprocess
+    
     print("🔧 Script de Instalación Inteligente - Seguros Sura AI")
     print("=" * 60)
     
@@ -76,34 +190,8 @@ def main():
     subprocess.run([sys.executable, "-m", "pip", "install", "--upgrade", "pip"], 
                   capture_output=True)
     
-    # Lista de paquetes críticos con alternativas
-    critical_packages = [
-        # Core Streamlit (más importante)
-        ("streamlit>=1.29.0,<2.0.0", "streamlit==1.29.0", "Streamlit (interfaz principal)"),
-        
-        # Procesamiento de datos (versión validada)
-        ("pandas>=2.2.0,<2.3.0", "pandas==2.2.3", "Pandas (manejo de datos)"),
-        
-        # Imágenes y vision
-        ("pillow>=10.0.0", "pillow==10.2.0", "Pillow (procesamiento imágenes)"),
-        ("requests>=2.31.0", "requests==2.31.0", "Requests (APIs)"),
-        
-        # APIs web
-        ("flask>=3.1.0,<4.0.0", "flask==3.1.2", "Flask (API expedición)"),
-        
-        # Base de datos
-        ("sqlalchemy>=2.0.0,<3.0.0", "sqlalchemy==2.0.23", "SQLAlchemy (base de datos)"),
-        ("openpyxl>=3.1.0", "openpyxl==3.1.2", "OpenPyXL (archivos Excel)"),
-    ]
-    
-    # Paquetes opcionales (para funcionalidad completa)
-    optional_packages = [
-        ("langchain>=0.3.0,<0.4.0", "langchain==0.3.27", "LangChain (agentes IA)"),
-        ("langchain-openai>=0.3.0,<0.4.0", "langchain-openai==0.3.32", "LangChain OpenAI"),
-        ("openai>=1.100.0,<2.0.0", "openai==1.107.0", "OpenAI Python client"),
-        ("chromadb>=1.0.0,<2.0.0", "chromadb==1.0.20", "ChromaDB (vector store)"),
-        ("sentence-transformers>=2.2.0", None, "Sentence Transformers (embeddings)"),
-    ]
+    critical_packages = CRITICAL_PACKAGES
+    optional_packages = OPTIONAL_PACKAGES
     
     successful_installs = 0
     total_critical = len(critical_packages)
@@ -173,4 +261,6 @@ def main():
     return True
 
 if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        sys.exit(0 if check_installed() else 1)
     main()
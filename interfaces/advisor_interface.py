@@ -5,7 +5,10 @@ Permite gestionar casos escalados, ver conversaciones y continuar interacciones.
 
 import streamlit as st
 import asyncio
-import pandas as pd
+import random
+import threading
+import time
+from collections import Counter
 from datetime import datetime
 from typing import Dict, Any, List, Optional
 
@@ -16,17 +19,112 @@ from utils.logging_config import get_logger
 from utils.ui_components import (
     apply_sura_theme, 
     render_sura_header, 
-    render_modern_alert
+    render_modern_alert,
+    format_datetime_display
 )
 
 logger = get_logger("advisor_interface")
 
+# Límites del polling adaptativo de transferencias (segundos)
+POLL_MIN_INTERVAL = 2.0
+POLL_MAX_INTERVAL = 30.0
+POLL_BACKOFF = 1.5
+POLL_JITTER = 0.2
+REARM_FACTOR = 2.0  # Rearmar el fragmento si el intervalo cambia en este factor respecto al armado
+CLIENT_POLL_MIN_INTERVAL = 1.0  # Máximo una consulta por segundo y caso
+
+# Valores iniciales del estado de sesión (todos inmutables: se comparten entre sesiones)
+_SESSION_DEFAULTS = {
+    "advisor_id": None,
+    "selected_session": None,
+    "refresh_trigger": 0,
+    "auto_refresh": True,
+    "poll_interval": 5.0,
+    "last_transfer_check": 0.0,
+    "notified_transfers": frozenset(),  # IDs de transferencias ya notificadas
+    "last_table_rows": (),  # Filas seleccionadas en la tabla de casos en el último run
+    "cases_table_ids": (),  # IDs en el orden en que se pintó la tabla de casos
+}
+
+# Estilo de las tarjetas prioritarias: (borde, fondo, icono, texto del botón)
+_PRIORITY_STYLE = {
+    "URGENT": ("#dc3545", "#f8d7da", "🚨", "🔥 ATENDER URGENTE"),  # Rojo urgente
+    "ACTIVE": ("#198754", "#d1e7dd", "👨‍💼", "📋 Continuar Caso"),  # Verde activo
+    "HIGH": ("#ffc107", "#fff3cd", "⚠️", "📝 Ver Caso"),  # Amarillo
+}
+
+_CARD_TEMPLATE = (
+    "<div style='border-left: 6px solid {border}; padding: 15px; margin: 10px 0; "
+    "background-color: {background}; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);'>"
+    "<strong>{icon} {short_id}...</strong><br>"
+    "<strong>Proceso:</strong> {process_type}<br>"
+    "<strong>Tipo:</strong> {user_type}<br>"
+    "<strong>Actualizado:</strong> {updated}<br>"
+    "<strong>Estado:</strong> <span style='color: {border}; font-weight: bold;'>{status}</span>"
+    "</div>"
+)
+
+@st.cache_resource
+def _get_orchestrator() -> AgentOrchestrator:
+    """Orquestador compartido: sus agentes y clientes se crean una sola vez por proceso"""
+    return AgentOrchestrator()
+
+@st.cache_resource
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop persistente en un hilo propio, compartido entre reruns y sesiones.
+    
+    El script se re-ejecuta en cada rerun, por eso el loop vive en st.cache_resource
+    y no como global del módulo. Al correr en su propio hilo, las corrutinas de
+    varios asesores se intercalan en vez de esperar turno.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="advisor-event-loop", daemon=True).start()
+    return loop
+
+def _run(coro):
+    """Ejecuta una corrutina en el event loop persistente y espera su resultado"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop()).result()
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _cached_active_sessions(_orchestrator: AgentOrchestrator, refresh_trigger: int) -> List[Dict[str, Any]]:
+    """Sesiones activas compartidas por todos los widgets de un mismo rerun"""
+    return _run(_orchestrator.get_active_sessions())
+
+@st.cache_data(ttl=15, show_spinner=False)
+def _cached_system_health(_orchestrator: AgentOrchestrator, refresh_trigger: int) -> Dict[str, Any]:
+    """Estado de salud del sistema con TTL corto"""
+    return _orchestrator.get_system_health()
+
+@st.cache_data(ttl=30, show_spinner=False)
+def _cached_process_states(session_id: str, token: Optional[str]) -> Dict[str, Dict]:
+    """Estados de cotización/expedición; el token invalida la caché cuando cambian"""
+    return db_manager.get_agent_states(session_id, ["quotation", "expedition"])
+
+def _partition_sessions(sessions: List[Dict[str, Any]]):
+    """
+    Agrupa las sesiones por estado y tipo de usuario en una sola pasada
+    
+    Returns:
+        Tupla (buckets, counts): listas por estado/tipo y sus conteos
+    """
+    buckets = {"transferred": [], "human_active": [], "client": [], "advisor": [], "all": sessions}
+    counts = Counter()
+    for session in sessions:
+        status = session.get("status", "active")
+        user_type = session["user_type"]
+        buckets.setdefault(status, []).append(session)
+        buckets.setdefault(user_type, []).append(session)
+        counts[status] += 1
+        counts[user_type] += 1
+    return buckets, counts
+
 class AdvisorInterface:
     """Interfaz principal para asesores humanos"""
     
     def __init__(self):
         self.logger = get_logger("advisor_interface")
-        self.orchestrator = AgentOrchestrator()
+        self.orchestrator = _get_orchestrator()
         
         st.set_page_config(
             page_title="Seguros Sura - Panel Asesor",
@@ -41,63 +139,20 @@ class AdvisorInterface:
     
     def _initialize_session_state(self):
         """Inicializa estado de la sesión Streamlit"""
-        if "advisor_id" not in st.session_state:
-            st.session_state.advisor_id = None
-        
-        if "selected_session" not in st.session_state:
-            st.session_state.selected_session = None
-        
-        if "refresh_trigger" not in st.session_state:
-            st.session_state.refresh_trigger = 0
-        
-        if "auto_refresh" not in st.session_state:
-            st.session_state.auto_refresh = True
+        for key, value in _SESSION_DEFAULTS.items():
+            st.session_state.setdefault(key, value)
+    
+    def _get_active_sessions(self) -> List[Dict[str, Any]]:
+        """Sesiones activas (cacheadas; el botón de actualizar invalida la caché)"""
+        return _cached_active_sessions(self.orchestrator, st.session_state.refresh_trigger)
+    
+    def _get_system_health(self) -> Dict[str, Any]:
+        """Estado de salud del sistema (cacheado)"""
+        return _cached_system_health(self.orchestrator, st.session_state.refresh_trigger)
     
     def run(self):
         """Ejecuta la interfaz principal"""
         
-        # Auto-refresh SIMPLIFICADO para detectar transferencias - 10 segundos
-        if st.session_state.auto_refresh:
-            import time
-            
-            # Verificar transferencias cada 10 segundos (más frecuente)
-            if not hasattr(st.session_state, 'last_transfer_check'):
-                st.session_state.last_transfer_check = time.time()
-                st.session_state.notified_transfers = set()  # Set de IDs ya notificados
-            
-            if time.time() - st.session_state.last_transfer_check > 10:  # Cada 10 segundos
-                st.session_state.last_transfer_check = time.time()
-                
-                try:
-                    current_sessions = asyncio.run(self.orchestrator.get_active_sessions())
-                    transferred_sessions = [s for s in current_sessions if s.get("status") == "transferred"]
-                    
-                    # Verificar si hay transferencias nuevas (por ID, no por conteo)
-                    new_transfers = []
-                    for session in transferred_sessions:
-                        session_id = session.get("session_id")
-                        if session_id not in st.session_state.notified_transfers:
-                            new_transfers.append(session)
-                            st.session_state.notified_transfers.add(session_id)
-                    
-                    # Si hay NUEVAS transferencias (no notificadas antes)
-                    if new_transfers:
-                        # Notificación MÚLTIPLE para asegurar que se vea
-                        for i, session in enumerate(new_transfers):
-                            st.toast(f"🚨 CASO TRANSFERIDO: {session.get('session_id', 'N/A')[:8]}...", icon="🚨")
-                            
-                        # Recargar interfaz
-                        st.rerun()
-                    
-                    # TAMBIÉN verificar mensajes nuevos del cliente actual
-                    if st.session_state.selected_session:
-                        new_client_messages = self._check_for_client_messages(st.session_state.selected_session)
-                        if new_client_messages:
-                            st.rerun()
-                
-                except Exception as e:
-                    self.logger.debug(f"Error verificando transferencias: {e}")
-        
         # Header
         self._render_header()
         
@@ -158,32 +213,131 @@ class AdvisorInterface:
             else:
                     st.info("⏸️ Desactivado")
             
-            try:
-                active_sessions = asyncio.run(self.orchestrator.get_active_sessions())
-                urgent_cases = len([s for s in active_sessions if s.get("status") == "transferred"])
-                
-                st.markdown("---")
-                st.markdown("### 📊 Resumen Rápido")
+            # Solo el sidebar se re-ejecuta periódicamente; el panel principal queda intacto
+            # Jitter para que varias pestañas de asesor no consulten la BD al mismo tiempo
+            run_every = (
+                st.session_state.poll_interval + random.uniform(-POLL_JITTER, POLL_JITTER)
+                if st.session_state.auto_refresh else None
+            )
+            # run_every solo se lee aquí, al registrar el fragmento en un run completo
+            st.session_state.armed_poll_interval = st.session_state.poll_interval
+            st.fragment(self._render_live_sidebar, run_every=run_every)()
+        
+        if st.session_state.selected_session:
+            # Fragmento: las acciones del caso solo re-ejecutan este panel
+            st.fragment(self._render_case_details)()
+        else:
+            self._render_dashboard()
+    
+    def _render_live_sidebar(self):
+        """Sidebar con resumen y casos; se ejecuta como fragmento con auto-refresh"""
+        try:
+            active_sessions = self._get_active_sessions()
+        except Exception as e:
+            self.logger.debug(f"Error obteniendo sesiones activas: {e}")
+            active_sessions = []
+        buckets, counts = _partition_sessions(active_sessions)
+        
+        # Aviso en vivo de transferencias; se crea en cada ejecución del fragmento
+        # (un placeholder no sobrevive entre ejecuciones en session_state)
+        alert_slot = st.empty()
+        
+        # Aviso pendiente de un tick que terminó en rerun completo
+        pending_alert = st.session_state.pop("pending_transfer_alert", None)
+        if pending_alert:
+            alert_slot.error(pending_alert)
+        
+        if st.session_state.auto_refresh:
+            now = time.time()
+            elapsed = now - st.session_state.last_transfer_check
+            if elapsed >= st.session_state.poll_interval - POLL_JITTER:
+                st.session_state.last_transfer_check = now
+                had_activity = self._check_for_transfers(buckets["transferred"], alert_slot)
+                st.session_state.poll_interval = self._next_poll_interval(had_activity)
                 
+                if self._timer_needs_rearm():
+                    # Run completo: vuelve a registrar el fragmento con el nuevo intervalo
+                    st.rerun()
+                st.session_state.pop("pending_transfer_alert", None)
+        
+        try:
+            urgent_cases = counts["transferred"]
+            
+            st.markdown("---")
+            
+            # Con un caso abierto el resumen queda plegado para dar espacio a los casos
+            with st.expander("📊 Resumen Rápido", expanded=not st.session_state.selected_session):
                 col1, col2 = st.columns(2)
                 with col1:
                     st.metric("Total", len(active_sessions), help="Casos totales")
                 with col2:
                     st.metric("Urgente", urgent_cases, delta="Requeridos" if urgent_cases > 0 else "Sin urgentes")
-                
-            except Exception as e:
-                st.error(f"Error en resumen: {str(e)}")
             
-            st.markdown("---")
-            self._render_cases_sidebar()
+        except Exception as e:
+            st.error(f"Error en resumen: {str(e)}")
         
-        if st.session_state.selected_session:
-            self._render_case_details()
-        else:
-            self._render_dashboard()
+        st.markdown("---")
+        self._render_cases_sidebar(buckets)
+    
+    def _timer_needs_rearm(self) -> bool:
+        """True si poll_interval se alejó del intervalo armado en REARM_FACTOR o más"""
+        armed = st.session_state.get("armed_poll_interval", st.session_state.poll_interval)
+        interval = st.session_state.poll_interval
+        return interval >= armed * REARM_FACTOR or interval * REARM_FACTOR <= armed
+    
+    def _next_poll_interval(self, had_activity: bool) -> float:
+        """Polling adaptativo: rápido con actividad, retroceso geométrico en reposo"""
+        if had_activity:
+            return POLL_MIN_INTERVAL
+        
+        # Con un caso abierto se sigue vigilando al cliente con más frecuencia
+        ceiling = 10.0 if st.session_state.selected_session else POLL_MAX_INTERVAL
+        return min(ceiling, st.session_state.poll_interval * POLL_BACKOFF)
     
-    def _render_cases_sidebar(self):
-        """Renderiza sidebar con lista de casos"""
+    def _check_for_transfers(self, transferred_sessions: List[Dict[str, Any]], alert_slot) -> bool:
+        """
+        Notifica transferencias nuevas y mensajes nuevos del cliente seleccionado
+        
+        Args:
+            transferred_sessions: Sesiones activas en estado "transferred"
+            alert_slot: Placeholder st.empty() donde se anuncian las transferencias nuevas
+        
+        Returns:
+            True si hubo transferencias nuevas
+        """
+        try:
+            # Verificar si hay transferencias nuevas (por ID, no por conteo)
+            current_ids = {s["session_id"] for s in transferred_sessions}
+            new_ids = current_ids - st.session_state.notified_transfers
+            new_transfers = [s for s in transferred_sessions if s["session_id"] in new_ids] if new_ids else []
+            if new_ids:
+                st.session_state.notified_transfers |= current_ids
+            
+            # Notificación MÚLTIPLE para asegurar que se vea; el fragmento pinta los casos a
+            # continuación, así que basta con actualizar el placeholder (sin st.rerun)
+            if new_transfers:
+                alert = f"🆕 {len(new_transfers)} caso(s) recién transferido(s)"
+                alert_slot.error(alert)
+                # Se conserva por si este tick termina en un rerun completo
+                st.session_state.pending_transfer_alert = alert
+            for session in new_transfers:
+                st.toast(f"🚨 CASO TRANSFERIDO: {session.get('session_id', 'N/A')[:8]}...", icon="🚨")
+            
+            # TAMBIÉN verificar mensajes nuevos del cliente actual (están en el panel principal)
+            if st.session_state.selected_session:
+                new_client_messages = self._check_for_client_messages(st.session_state.selected_session)
+                if new_client_messages:
+                    st.session_state.poll_interval = POLL_MIN_INTERVAL
+                    st.rerun()
+            
+            return bool(new_transfers)
+        
+        except Exception as e:
+            self.logger.debug(f"Error verificando transferencias: {e}")
+            return False
+    
+    def _render_cases_sidebar(self, buckets: Dict[str, List[Dict[str, Any]]]):
+        """Renderiza sidebar con lista de casos ya particionados por estado y tipo"""
         st.subheader("Casos Activos")
         
         # Botón de refresh manual
@@ -191,32 +345,20 @@ class AdvisorInterface:
             st.session_state.refresh_trigger += 1
             st.rerun()
         
-        # Obtener sesiones activas
-        active_sessions = asyncio.run(self.orchestrator.get_active_sessions())
+        active_sessions = buckets["all"]
         
         if not active_sessions:
             st.info("No hay casos activos")
             return
         
         # NOTIFICACIONES DE TRANSFERENCIAS NUEVAS - MEJORADO
-        transferred_sessions = [s for s in active_sessions if s.get("status") == "transferred"]
-        human_active_sessions = [s for s in active_sessions if s.get("status") == "human_active"]
+        transferred_sessions = buckets["transferred"]
+        human_active_sessions = buckets["human_active"]
         
-        if transferred_sessions:
-            st.error(f"🚨 {len(transferred_sessions)} CASO(S) TRANSFERIDO(S) - ATENCIÓN INMEDIATA REQUERIDA")
-            
-            # Mostrar casos transferidos primero con estilo destacado
-            for session in transferred_sessions:
-                self._render_priority_case_card(session, priority="URGENT")
-        
-        if human_active_sessions:
-            st.success(f"👨‍💼 {len(human_active_sessions)} caso(s) bajo tu atención")
-            
-            # Mostrar casos que ya estás atendiendo
-            for session in human_active_sessions:
-                self._render_priority_case_card(session, priority="ACTIVE")
+        # Los casos prioritarios se pintan arriba de los filtros
+        priority_container = st.container()
         
-        # Filtros
+        # Filtros (se leen antes de pintar para conocer todos los casos visibles)
         st.subheader("🔍 Filtros")
         
         filter_type = st.selectbox(
@@ -234,71 +376,98 @@ class AdvisorInterface:
         else:
             filtered_sessions = active_sessions
         
+        # Estado de todos los casos visibles en una sola pasada del event loop
+        ids = list(dict.fromkeys(
+            s["session_id"] for s in transferred_sessions + human_active_sessions + filtered_sessions
+        ))
+        status_map = dict(zip(ids, _run(self._fetch_all_statuses(ids))))
+        
+        with priority_container:
+            if transferred_sessions:
+                st.error(f"🚨 {len(transferred_sessions)} CASO(S) TRANSFERIDO(S) - ATENCIÓN INMEDIATA REQUERIDA")
+                
+                # Mostrar casos transferidos primero con estilo destacado
+                for session in transferred_sessions:
+                    self._render_priority_case_card(
+                        session, priority="URGENT", case_info=status_map[session["session_id"]]
+                    )
+            
+            if human_active_sessions:
+                st.success(f"👨‍💼 {len(human_active_sessions)} caso(s) bajo tu atención")
+                
+                # Mostrar casos que ya estás atendiendo
+                for session in human_active_sessions:
+                    self._render_priority_case_card(
+                        session, priority="ACTIVE", case_info=status_map[session["session_id"]]
+                    )
+        
         # Mostrar casos
         st.subheader(f"📊 Casos ({len(filtered_sessions)})")
         
-        for session in filtered_sessions:
-            self._render_case_card(session)
+        self._render_cases_table(filtered_sessions, status_map)
     
-    def _render_case_card(self, session: Dict[str, Any]):
-        """Renderiza tarjeta de caso individual"""
-        session_id = session["session_id"]
-        
-        # Obtener información adicional
-        try:
-            session_status = asyncio.run(self.orchestrator.get_session_status(session_id))
-        except:
-            session_status = {"exists": False}
+    async def _fetch_all_statuses(self, session_ids: List[str]) -> List[Any]:
+        """Obtiene el estado de varias sesiones en un único event loop"""
+        return await asyncio.gather(
+            *(self.orchestrator.get_session_status(session_id) for session_id in session_ids),
+            return_exceptions=True
+        )
+    
+    def _case_priority_icon(self, session_status: Any) -> str:
+        """Icono de prioridad visual según el estado del caso"""
+        # Estado precargado en _render_cases_sidebar (puede ser una excepción)
+        if isinstance(session_status, BaseException) or not session_status.get("exists"):
+            return "⚪"
         
-        # Determinar prioridad visual
-        if session_status.get("exists"):
-            agent_states = session_status.get("agent_states", {})
-            has_escalation = any("escalation" in str(state) for state in agent_states.values())
-            priority_color = "🔴" if has_escalation else "🟡"
-        else:
-            priority_color = "⚪"
+        return "🔴" if session_status.get("escalated", False) else "🟡"
+    
+    def _render_cases_table(self, sessions: List[Dict[str, Any]], status_map: Dict[str, Any]):
+        """Renderiza la lista de casos como una única tabla seleccionable"""
+        session_ids = [session["session_id"] for session in sessions]
+        
+        # Columnas como dict de listas: st.dataframe las acepta sin DataFrame previo
+        table = {
+            "": [self._case_priority_icon(status_map[session_id]) for session_id in session_ids],
+            "Caso": [f"{session_id[:8]}..." for session_id in session_ids],
+            "Tipo": [session["user_type"] for session in sessions],
+            "Actualizado": [self._format_datetime(session["updated_at"]) for session in sessions],
+            "Estado": [session.get("status", "active") for session in sessions],
+        }
+        
+        # Clave fija: la selección sobrevive a cambios en la lista de casos
+        event = st.dataframe(
+            table,
+            hide_index=True,
+            use_container_width=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key="cases_table"
+        )
         
-        # Información del caso
-        updated_time = self._format_datetime(session["updated_at"])
+        # El índice de fila se refiere a la tabla sobre la que se hizo clic (la del run
+        # anterior); la selección persiste entre reruns, así que solo se actúa cuando cambia
+        rows = tuple(event.selection.rows)
+        clicked_ids = st.session_state.cases_table_ids
+        st.session_state.cases_table_ids = tuple(session_ids)
         
-        with st.container():
-            st.markdown(f"""
-            **{priority_color} Caso: {session_id[:8]}...**  
-            Tipo: {session["user_type"]}  
-            Actualizado: {updated_time}  
-            Estado: {session.get("status", "active")}
-            """)
-            
-            if st.button(f"Ver Caso", key=f"select_{session_id}"):
-                st.session_state.selected_session = session_id
+        if rows != st.session_state.last_table_rows:
+            st.session_state.last_table_rows = rows
+            if rows and rows[0] < len(clicked_ids):
+                st.session_state.selected_session = clicked_ids[rows[0]]
                 st.rerun()
-            
-            st.markdown("---")
     
-    def _render_priority_case_card(self, session: Dict[str, Any], priority: str = "HIGH"):
+    def _render_priority_case_card(self, session: Dict[str, Any], priority: str = "HIGH",
+                                   case_info: Any = None):
         """Renderiza tarjeta de caso con información completa"""
         session_id = session["session_id"]
         
         # Color y estilo según prioridad
-        if priority == "URGENT":
-            border_color = "#dc3545"  # Rojo urgente
-            bg_color = "#f8d7da"
-            icon = "🚨"
-            button_text = "🔥 ATENDER URGENTE"
-        elif priority == "ACTIVE":
-            border_color = "#198754"  # Verde activo
-            bg_color = "#d1e7dd"
-            icon = "👨‍💼"
-            button_text = "📋 Continuar Caso"
-        else:
-            border_color = "#ffc107"  # Amarillo
-            bg_color = "#fff3cd"
-            icon = "⚠️"
-            button_text = "📝 Ver Caso"
+        border_color, bg_color, icon, button_text = _PRIORITY_STYLE.get(priority, _PRIORITY_STYLE["HIGH"])
         
-        # Obtener información adicional del caso
+        # Información del caso precargada en _render_cases_sidebar
         try:
-            case_info = asyncio.run(self.orchestrator.get_session_status(session_id))
+            if isinstance(case_info, BaseException):
+                raise case_info
             agent_states = case_info.get("agent_states", {})
             
             # Detectar tipo de proceso
@@ -315,15 +484,16 @@ class AdvisorInterface:
         updated_time = self._format_datetime(session["updated_at"])
         
         # Contenedor con información completa
-        st.markdown(f"""
-        <div style='border-left: 6px solid {border_color}; padding: 15px; margin: 10px 0; background-color: {bg_color}; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);'>
-        <strong>{icon} {session_id[:8]}...</strong><br>
-        <strong>Proceso:</strong> {process_type}<br>
-        <strong>Tipo:</strong> {session["user_type"]}<br>
-        <strong>Actualizado:</strong> {updated_time}<br>
-        <strong>Estado:</strong> <span style='color: {border_color}; font-weight: bold;'>{session.get("status", "active").upper()}</span>
-        </div>
-        """, unsafe_allow_html=True)
+        st.markdown(_CARD_TEMPLATE.format_map({
+            "border": border_color,
+            "background": bg_color,
+            "icon": icon,
+            "short_id": session_id[:8],
+            "process_type": process_type,
+            "user_type": session["user_type"],
+            "updated": updated_time,
+            "status": session.get("status", "active").upper(),
+        }), unsafe_allow_html=True)
         
         # Botón para atender caso
         if st.button(button_text, key=f"priority_{session_id}_{priority}", use_container_width=True):
@@ -334,17 +504,27 @@ class AdvisorInterface:
         """Renderiza dashboard profesional"""
         st.title("Dashboard de Asesor")
         
+        # Sesiones y salud se consultan una sola vez y se reparten a cada sección
+        try:
+            health = self._get_system_health()
+        except Exception as e:
+            health = {"orchestrator": f"error: {str(e)}"}
+        
+        try:
+            active_sessions = self._get_active_sessions()
+        except Exception as e:
+            st.error(f"Error cargando métricas: {str(e)}")
+            active_sessions = []
+        
         # Métricas generales empresariales
         
         try:
-            active_sessions = asyncio.run(self.orchestrator.get_active_sessions())
-            system_health = self.orchestrator.get_system_health()
-            
             # Preparar métricas empresariales
             total_cases = len(active_sessions)
-            escalated_count = len([s for s in active_sessions if s.get("status") == "transferred"])
-            client_sessions = len([s for s in active_sessions if s["user_type"] == "client"])
-            system_healthy = system_health.get("orchestrator") == "healthy"
+            _, counts = _partition_sessions(active_sessions)
+            escalated_count = counts["transferred"]
+            client_sessions = counts["client"]
+            system_healthy = health.get("orchestrator") == "healthy"
             
             # Métricas con Streamlit nativo (más confiable)
             col1, col2, col3, col4 = st.columns(4)
@@ -384,7 +564,6 @@ class AdvisorInterface:
         st.subheader("Estado del Sistema")
         
         try:
-            health = self.orchestrator.get_system_health()
             self._render_system_health(health)
         except Exception as e:
             st.error(f"Error obteniendo estado del sistema: {str(e)}")
@@ -394,11 +573,11 @@ class AdvisorInterface:
         
         with col1:
             st.subheader("📊 Estadísticas de Uso")
-            self._render_usage_statistics()
+            self._render_usage_statistics(active_sessions)
         
         with col2:
             st.subheader("📋 Actividad Reciente")
-            self._render_recent_activity_table()
+            self._render_recent_activity_table(active_sessions)
     
     def _render_system_health(self, health: Dict[str, Any]):
         """Renderiza estado de salud del sistema organizado"""
@@ -437,11 +616,9 @@ class AdvisorInterface:
             else:
                 st.write("🟡 Sin datos")
     
-    def _render_usage_statistics(self):
+    def _render_usage_statistics(self, active_sessions: List[Dict[str, Any]]):
         """Renderiza estadísticas de uso con gráficos"""
         try:
-            active_sessions = asyncio.run(self.orchestrator.get_active_sessions())
-            
             # Estadísticas por tipo de proceso
             process_counts = {}
             status_counts = {}
@@ -464,7 +641,7 @@ class AdvisorInterface:
             
             # Métricas adicionales
             st.markdown("**Resumen:**")
-            total_transferred = len([s for s in active_sessions if s.get("status") == "transferred"])
+            total_transferred = status_counts.get("transferred", 0)
             resolution_rate = ((len(active_sessions) - total_transferred) / len(active_sessions) * 100) if active_sessions else 0
             
             col1, col2 = st.columns(2)
@@ -476,23 +653,22 @@ class AdvisorInterface:
         except Exception as e:
             st.error(f"Error en estadísticas: {str(e)}")
     
-    def _render_recent_activity_table(self):
+    def _render_recent_activity_table(self, recent_sessions: List[Dict[str, Any]]):
         """Renderiza tabla de actividad reciente compacta"""
         try:
-            recent_sessions = asyncio.run(self.orchestrator.get_active_sessions())
-            
             if recent_sessions:
+                import pandas as pd
+                
                 # Mostrar solo los últimos 8 para que quepa bien
-                df_data = []
-                for session in recent_sessions[-8:]:
-                    df_data.append({
-                        "ID": session["session_id"][:6] + "...",
-                        "Tipo": session["user_type"],
-                        "Estado": session["status"],
-                        "Hora": self._format_datetime(session["updated_at"])[:5]  # Solo HH:MM
-                    })
+                last_sessions = recent_sessions[-8:]
                 
-                df = pd.DataFrame(df_data)
+                # Construcción columnar: una lista por columna
+                df = pd.DataFrame({
+                    "ID": [session["session_id"][:6] + "..." for session in last_sessions],
+                    "Tipo": [session["user_type"] for session in last_sessions],
+                    "Estado": [session["status"] for session in last_sessions],
+                    "Hora": [self._format_datetime(session["updated_at"], "%H:%M") for session in last_sessions]
+                })
                 st.dataframe(df, use_container_width=True, height=280)
             else:
                 st.info("Sin actividad reciente")
@@ -515,39 +691,59 @@ class AdvisorInterface:
                 st.session_state.selected_session = None
                 st.rerun()
         
-        # Obtener información del caso
+        # Obtener información del caso (y el historial solo si la vista elegida lo muestra)
+        view_key = f"tab_{session_id}"
+        with_history = st.session_state.get(view_key, "💬 Conversación") == "💬 Conversación"
+        
         try:
-            session_status = asyncio.run(self.orchestrator.get_session_status(session_id))
+            session_status, history = _run(self._fetch_case_bundle(session_id, with_history))
             
             if not session_status.get("exists"):
                 st.error("Caso no encontrado")
                 return
             
-            # Tabs del caso
-            tab1, tab2, tab3, tab4 = st.tabs(["💬 Conversación", "📊 Resumen", "🔧 Acciones", "📋 Estado"])
-            
-            with tab1:
-                self._render_conversation_tab(session_id, session_status)
-            
-            with tab2:
-                self._render_summary_tab(session_status)
-            
-            with tab3:
-                self._render_actions_tab(session_id, session_status)
-            
-            with tab4:
-                self._render_status_tab(session_status)
+            # Vistas del caso: st.tabs ejecuta todas las pestañas, el radio solo la elegida
+            views = {
+                "💬 Conversación": lambda: self._render_conversation_tab(session_id, session_status, history),
+                "📊 Resumen": lambda: self._render_summary_tab(session_status),
+                "🔧 Acciones": lambda: self._render_actions_tab(session_id, session_status),
+                "📋 Estado": lambda: self._render_status_tab(session_status),
+            }
+            
+            choice = st.radio(
+                "Vista:",
+                list(views),
+                horizontal=True,
+                label_visibility="collapsed",
+                key=view_key
+            )
+            views[choice]()
         
         except Exception as e:
             st.error(f"Error cargando caso: {str(e)}")
     
-    def _render_conversation_tab(self, session_id: str, session_status: Dict[str, Any]):
-        """Renderiza tab de conversación"""
+    async def _fetch_case_bundle(self, session_id: str, with_history: bool):
+        """
+        Obtiene estado e historial del caso en un único paso del event loop
+        
+        Returns:
+            Tupla (session_status, history); history es None si no se pidió
+        """
+        if not with_history:
+            return await self.orchestrator.get_session_status(session_id), None
+        
+        # El historial va primero: su hilo arranca antes de que el estado
+        # (síncrono por dentro) ocupe el loop, así ambas consultas se solapan
+        history, session_status = await asyncio.gather(
+            asyncio.to_thread(db_manager.get_conversation_history, session_id),
+            self.orchestrator.get_session_status(session_id)
+        )
+        return session_status, history
+    
+    def _render_conversation_tab(self, session_id: str, session_status: Dict[str, Any], history: List[Any]):
+        """Renderiza tab de conversación con el historial completo precargado"""
         
-        # Obtener historial completo
         try:
-            history = db_manager.get_conversation_history(session_id)
-            
             if not history:
                 st.info("No hay historial de conversación")
                 return
@@ -555,8 +751,9 @@ class AdvisorInterface:
             # Mostrar conversación
             st.subheader("💬 Historial de Conversación")
             
-            for message in history:
-                self._render_message_for_advisor(message)
+            # Todo el historial en un único st.markdown (un solo mensaje al frontend)
+            html_parts = [self._build_message_html(message) for message in history]
+            st.markdown("\n".join(html_parts), unsafe_allow_html=True)
             
             # INFORMACIÓN DE COTIZACIÓN/EXPEDICIÓN SI APLICA
             self._render_process_info(session_id)
@@ -589,32 +786,25 @@ class AdvisorInterface:
         except Exception as e:
             st.error(f"Error cargando conversación: {str(e)}")
     
-    def _render_message_for_advisor(self, message):
-        """Renderiza mensaje para vista de asesor"""
+    def _build_message_html(self, message) -> str:
+        """Construye el HTML de un mensaje para la vista de asesor"""
         role_icon = "👤" if message.agent_type == "user" else "🤖"
         
         if message.agent_type == "user":
-            st.markdown(f"""
-            <div style='background-color: #e3f2fd; padding: 10px; border-radius: 10px; margin: 5px 0;'>
-                <strong>{role_icon} Cliente ({message.timestamp.strftime('%H:%M')})</strong><br>
-                {message.content}
-            </div>
-            """, unsafe_allow_html=True)
+            background, author = "#e3f2fd", f"{role_icon} Cliente"
         elif message.agent_type == "human_advisor":
-            st.markdown(f"""
-            <div style='background-color: #fff3e0; padding: 10px; border-radius: 10px; margin: 5px 0;'>
-                <strong>👨‍💼 Asesor ({message.timestamp.strftime('%H:%M')})</strong><br>
-                {message.content}
-            </div>
-            """, unsafe_allow_html=True)
+            background, author = "#fff3e0", "👨‍💼 Asesor"
         else:
             agent_name = message.agent_type.replace("_", " ").title()
-            st.markdown(f"""
-            <div style='background-color: #f1f8e9; padding: 10px; border-radius: 10px; margin: 5px 0;'>
-                <strong>{role_icon} {agent_name} ({message.timestamp.strftime('%H:%M')})</strong><br>
-                {message.content}
-            </div>
-            """, unsafe_allow_html=True)
+            background, author = "#f1f8e9", f"{role_icon} {agent_name}"
+        
+        # Sin sangría: al concatenar, las líneas indentadas se interpretarían como bloque de código
+        return (
+            f"<div style='background-color: {background}; padding: 10px; border-radius: 10px; margin: 5px 0;'>"
+            f"<strong>{author} ({message.timestamp.strftime('%H:%M')})</strong><br>"
+            f"{message.content}"
+            "</div>"
+        )
     
     def _render_summary_tab(self, session_status: Dict[str, Any]):
         """Renderiza tab de resumen"""
@@ -707,12 +897,10 @@ class AdvisorInterface:
     def _send_advisor_response(self, session_id: str, response: str):
         """Envía respuesta del asesor al cliente CON CONTROL PROFESIONAL"""
         try:
-            # Marcar sesión como atendida por humano
-            db_manager.update_session_status(session_id, "human_active")
-            
-            # Agregar mensaje a la base de datos como respuesta de asesor humano
-            db_manager.add_message(
+            # Respuesta de asesor humano y sesión marcada como atendida por humano
+            db_manager.add_message_and_update_status(
                 session_id=session_id,
+                status="human_active",
                 agent_type="human_advisor",
                 content=response,
                 metadata={
@@ -738,7 +926,7 @@ class AdvisorInterface:
             
             st.success("✅ Respuesta enviada al cliente exitosamente")
             st.info("🔄 **Sesión ahora bajo control humano** - El asistente AI está pausado")
-            st.rerun()
+            st.rerun(scope="fragment")
         
         except Exception as e:
             st.error(f"❌ Error enviando respuesta: {str(e)}")
@@ -746,36 +934,37 @@ class AdvisorInterface:
     def _close_case(self, session_id: str):
         """Cierra un caso y devuelve control al asistente PROFESIONALMENTE"""
         try:
-            # Devolver control al asistente AI
-            db_manager.update_session_status(session_id, "active")
-            
-            # Limpiar metadata de control humano (método simplificado)
-            try:
-                # Solo marcar como cerrado en los metadatos del mensaje
-                pass  # La metadata se maneja en el mensaje automático
-            except Exception as meta_error:
-                self.logger.warning(f"No se pudo limpiar metadata: {meta_error}")
-            
-            # Enviar mensaje automático al cliente
-            db_manager.add_message(
-                session_id=session_id,
-                agent_type="human_advisor",
-                content="Gracias por contactarnos. Tu caso ha sido resuelto. El asistente inteligente puede continuar ayudándote con otras consultas.",
-                metadata={
-                    "advisor_id": st.session_state.advisor_id,
-                    "response_type": "case_closure",
-                    "automated": True
-                }
+            # Mensaje automático al cliente y control devuelto al asistente AI;
+            # la metadata de cierre viaja en el mensaje automático
+            self._ai_handoff(
+                session_id,
+                "Gracias por contactarnos. Tu caso ha sido resuelto. El asistente inteligente puede continuar ayudándote con otras consultas.",
+                {"response_type": "case_closure", "automated": True}
             )
             
             st.success("✅ Caso cerrado exitosamente")
             st.info("🤖 **Control devuelto al asistente AI** - El cliente puede continuar normalmente")
             st.session_state.selected_session = None
+            
+            # El estado por caso son escalares, pero se libera al cerrar para que
+            # no crezca con cada caso atendido durante la jornada
+            for prefix in ("msg_token", "last_poll", "db_version", "tab"):
+                st.session_state.pop(f"{prefix}_{session_id}", None)
             st.rerun()
         
         except Exception as e:
             st.error(f"❌ Error cerrando caso: {str(e)}")
     
+    def _ai_handoff(self, session_id: str, content: str, metadata: Dict[str, Any]):
+        """Envía el mensaje del asesor y devuelve la sesión a la IA en una sola transacción"""
+        db_manager.add_message_and_update_status(
+            session_id=session_id,
+            status="active",
+            agent_type="human_advisor",
+            content=content,
+            metadata={"advisor_id": st.session_state.advisor_id, **metadata}
+        )
+    
     def _reactivate_session(self, session_id: str):
         """Reactiva una sesión para que pueda seguir con el agente"""
         try:
@@ -789,8 +978,8 @@ class AdvisorInterface:
         """Actualiza estado de sesión"""
         try:
             db_manager.update_session_status(session_id, new_status)
+            # Sin rerun: el estado se muestra en otras vistas, que lo releen al abrirse
             st.success(f"Estado actualizado a: {new_status}")
-            st.rerun()
         
         except Exception as e:
             st.error(f"Error actualizando estado: {str(e)}")
@@ -809,8 +998,8 @@ class AdvisorInterface:
                 }
             )
             
+            # Sin rerun: la nota aparece en la conversación la próxima vez que se abra
             st.success("Nota guardada")
-            st.rerun()
         
         except Exception as e:
             st.error(f"Error guardando nota: {str(e)}")
@@ -818,24 +1007,28 @@ class AdvisorInterface:
     def _render_process_info(self, session_id: str):
         """Renderiza información de procesos activos (cotización/expedición)"""
         try:
-            # Obtener estados de agentes
-            quotation_state = db_manager.get_agent_state(session_id, "quotation")
-            expedition_state = db_manager.get_agent_state(session_id, "expedition")
+            # Obtener estados de agentes (solo se releen si cambió su token)
+            token = db_manager.get_agent_state_token(session_id)
+            states = _cached_process_states(session_id, token)
+            quotation_state = states.get("quotation")
+            expedition_state = states.get("expedition")
             
             if quotation_state:
                 st.subheader("🚗 Información de Cotización")
                 
                 with st.expander("Ver detalles de cotización", expanded=True):
+                    # Todos los campos en un único elemento markdown
+                    lines = []
                     if quotation_state.get("vehicle_details"):
                         vehicle = quotation_state["vehicle_details"]
-                        st.write(f"**Vehículo:** {vehicle.get('marca', 'N/A')} {vehicle.get('modelo', 'N/A')} {vehicle.get('linea', 'N/A')}")
-                        st.write(f"**Clase:** {vehicle.get('clase', 'N/A')} | **Color:** {vehicle.get('color', 'N/A')}")
+                        lines.append(f"**Vehículo:** {vehicle.get('marca', 'N/A')} {vehicle.get('modelo', 'N/A')} {vehicle.get('linea', 'N/A')}")
+                        lines.append(f"**Clase:** {vehicle.get('clase', 'N/A')} | **Color:** {vehicle.get('color', 'N/A')}")
                     
                     if quotation_state.get("plans_quoted"):
-                        st.write(f"**Planes cotizados:** {', '.join(quotation_state['plans_quoted'])}")
+                        lines.append(f"**Planes cotizados:** {', '.join(quotation_state['plans_quoted'])}")
                     
-                    quotation_state_value = quotation_state.get("quotation_state", "N/A")
-                    st.write(f"**Estado:** {quotation_state_value}")
+                    lines.append(f"**Estado:** {quotation_state.get('quotation_state', 'N/A')}")
+                    st.markdown("\n\n".join(lines))
                     
                     # Botón para continuar cotización
                     if st.button("🔄 Continuar Cotización como IA"):
@@ -845,18 +1038,20 @@ class AdvisorInterface:
                 st.subheader("📋 Información de Expedición")
                 
                 with st.expander("Ver detalles de expedición", expanded=True):
-                    st.write(f"**Estado:** {expedition_state.get('expedition_state', 'N/A')}")
+                    # Todos los campos en un único elemento markdown
+                    lines = [f"**Estado:** {expedition_state.get('expedition_state', 'N/A')}"]
                     
                     if expedition_state.get("selected_plan"):
-                        st.write(f"**Plan seleccionado:** {expedition_state['selected_plan']}")
+                        lines.append(f"**Plan seleccionado:** {expedition_state['selected_plan']}")
                     
                     if expedition_state.get("client_data"):
-                        st.write("**Datos del cliente:** Disponibles")
                         client_data = expedition_state["client_data"]
-                        for key, value in client_data.items():
-                            st.write(f"• **{key}:** {value}")
+                        lines.append("**Datos del cliente:** Disponibles\n\n" + "\n".join(
+                            f"- **{key}:** {value}" for key, value in client_data.items()
+                        ))
                     else:
-                        st.write("**Datos del cliente:** Pendientes")
+                        lines.append("**Datos del cliente:** Pendientes")
+                    st.markdown("\n\n".join(lines))
                     
                     # Botones de acción para expedición
                     col1, col2 = st.columns(2)
@@ -873,22 +1068,15 @@ class AdvisorInterface:
     def _return_to_ai(self, session_id: str):
         """Devuelve el control al asistente IA"""
         try:
-            db_manager.update_session_status(session_id, "active")
-            
-            # Mensaje automático al cliente
-            db_manager.add_message(
-                session_id=session_id,
-                agent_type="human_advisor",
-                content="Perfecto, he resuelto tu consulta. El asistente inteligente puede continuar ayudándote con otras preguntas.",
-                metadata={
-                    "advisor_id": st.session_state.advisor_id,
-                    "response_type": "handoff_to_ai",
-                    "automated": True
-                }
+            # Mensaje automático al cliente y sesión de vuelta a la IA
+            self._ai_handoff(
+                session_id,
+                "Perfecto, he resuelto tu consulta. El asistente inteligente puede continuar ayudándote con otras preguntas.",
+                {"response_type": "handoff_to_ai", "automated": True}
             )
             
             st.success("✅ Control devuelto al asistente IA")
-            st.rerun()
+            st.rerun(scope="fragment")
         
         except Exception as e:
             st.error(f"Error devolviendo control: {str(e)}")
@@ -896,23 +1084,15 @@ class AdvisorInterface:
     def _continue_quotation_as_ai(self, session_id: str):
         """Permite al asesor activar que la IA continúe con la cotización"""
         try:
-            # Marcar sesión para que IA continúe cotización
-            db_manager.add_message(
-                session_id=session_id,
-                agent_type="human_advisor",
-                content="He revisado tu solicitud de cotización. Te ayudo a completar el proceso ahora.",
-                metadata={
-                    "advisor_id": st.session_state.advisor_id,
-                    "action": "continue_quotation",
-                    "trigger_ai": True
-                }
+            # Marcar sesión para que IA continúe cotización y devolverle el control
+            self._ai_handoff(
+                session_id,
+                "He revisado tu solicitud de cotización. Te ayudo a completar el proceso ahora.",
+                {"action": "continue_quotation", "trigger_ai": True}
             )
             
-            # Devolver control a IA específicamente para cotización
-            db_manager.update_session_status(session_id, "active")
-            
             st.success("✅ IA continuará con la cotización")
-            st.rerun()
+            st.rerun(scope="fragment")
         
         except Exception as e:
             st.error(f"Error activando cotización: {str(e)}")
@@ -920,23 +1100,15 @@ class AdvisorInterface:
     def _continue_expedition_as_ai(self, session_id: str):
         """Permite al asesor activar que la IA continúe con la expedición"""
         try:
-            # Marcar sesión para que IA continúe expedición
-            db_manager.add_message(
-                session_id=session_id,
-                agent_type="human_advisor",
-                content="He revisado tus datos. Procedo a completar la expedición de tu póliza.",
-                metadata={
-                    "advisor_id": st.session_state.advisor_id,
-                    "action": "continue_expedition",
-                    "trigger_ai": True
-                }
+            # Marcar sesión para que IA continúe expedición y devolverle el control
+            self._ai_handoff(
+                session_id,
+                "He revisado tus datos. Procedo a completar la expedición de tu póliza.",
+                {"action": "continue_expedition", "trigger_ai": True}
             )
             
-            # Cambiar estado a activo para que IA tome control
-            db_manager.update_session_status(session_id, "active")
-            
             st.success("✅ IA continuará con la expedición")
-            st.rerun()
+            st.rerun(scope="fragment")
         
         except Exception as e:
             st.error(f"Error activando expedición: {str(e)}")
@@ -945,19 +1117,22 @@ class AdvisorInterface:
         """Permite al asesor confirmar expedición manualmente"""
         try:
             # Recuperar información de expedición
-            expedition_state = db_manager.get_agent_state(session_id, "expedition")
-            quotation_state = db_manager.get_agent_state(session_id, "quotation")
+            states = db_manager.get_agent_states(session_id, ["expedition", "quotation"])
+            expedition_state = states.get("expedition")
+            quotation_state = states.get("quotation")
             
             if not expedition_state or not quotation_state:
                 st.error("❌ No se encontró información completa para expedición")
                 return
             
             # Simulación de expedición manual
-            policy_number = f"POL-{datetime.now().strftime('%Y%m%d%H%M%S')}"
+            # Nanosegundos en hexadecimal: dos asesores en el mismo segundo no colisionan
+            policy_number = f"POL-{time.time_ns():X}"
             
-            # Mensaje de confirmación al cliente
-            db_manager.add_message(
+            # Mensaje de confirmación al cliente y sesión cerrada como completada
+            db_manager.add_message_and_update_status(
                 session_id=session_id,
+                status="completed",
                 agent_type="human_advisor",
                 content=f"🎉 ¡Felicitaciones! Tu póliza ha sido expedida exitosamente.\n\n**Número de póliza:** {policy_number}\n\nRecibirás los documentos en tu correo electrónico en los próximos minutos.",
                 metadata={
@@ -967,12 +1142,9 @@ class AdvisorInterface:
                 }
             )
             
-            # Cerrar la sesión como completada
-            db_manager.update_session_status(session_id, "completed")
-            
             st.success(f"✅ Póliza expedida manualmente: {policy_number}")
             st.balloons()
-            st.rerun()
+            st.rerun(scope="fragment")
         
         except Exception as e:
             st.error(f"Error en expedición manual: {str(e)}")
@@ -982,29 +1154,34 @@ class AdvisorInterface:
         Verificación ESPECÍFICA para mensajes nuevos del cliente
         Para sincronización asesor ← cliente
         """
+        # Tope de frecuencia por caso, sin importar cuántos reruns lo invoquen
+        poll_key = f"last_poll_{session_id}"
+        now = time.monotonic()
+        if now - st.session_state.get(poll_key, 0.0) < CLIENT_POLL_MIN_INTERVAL:
+            return False
+        st.session_state[poll_key] = now
+        
         try:
-            # Obtener historial completo de la sesión
-            db_history = db_manager.get_conversation_history(session_id)
-            
-            # Filtrar SOLO mensajes del cliente (user)
-            client_messages_db = [
-                msg for msg in db_history 
-                if msg.agent_type == "user"
-            ]
-            
-            # Obtener mensajes del cliente en el contexto actual
-            if not hasattr(st.session_state, f'client_messages_{session_id}'):
-                st.session_state.__dict__[f'client_messages_{session_id}'] = []
-            
-            current_client_messages = st.session_state.__dict__[f'client_messages_{session_id}']
-            
-            # Si hay más mensajes del cliente en BD que en el contexto
-            if len(client_messages_db) > len(current_client_messages):
-                # Actualizar el contador
-                st.session_state.__dict__[f'client_messages_{session_id}'] = client_messages_db
+            # Sin escrituras en la BD desde el último sondeo no hay nada que consultar
+            version_key = f"db_version_{session_id}"
+            db_version = db_manager.get_change_counter()
+            if db_version == st.session_state.get(version_key):
+                return False
+            st.session_state[version_key] = db_version
+            
+            # Token de cambios: sin mensajes nuevos basta una búsqueda en el índice;
+            # el historial completo se carga al pintar la conversación
+            token_key = f"msg_token_{session_id}"
+            current_token = st.session_state.setdefault(token_key, 0)
+            latest_token = db_manager.get_client_message_token(session_id)
+            
+            # Si hay mensajes del cliente posteriores al último visto
+            if latest_token > current_token:
+                # Contar solo el delta y avanzar el token
+                new_count = db_manager.count_client_messages(session_id, after_token=current_token)
+                st.session_state[token_key] = latest_token
                 
                 # Mostrar notificación discreta
-                new_count = len(client_messages_db) - len(current_client_messages)
                 st.toast(f"💬 {new_count} nuevo(s) mensaje(s) del cliente", icon="💬")
                 return True
             
@@ -1014,13 +1191,12 @@ class AdvisorInterface:
             self.logger.error(f"Error verificando mensajes del cliente: {str(e)}")
             return False
     
-    def _format_datetime(self, datetime_str: str) -> str:
+    def _format_datetime(self, datetime_str: str, fmt: str = "%d/%m/%Y %H:%M") -> str:
         """Formatea datetime para display"""
-        try:
-            dt = datetime.fromisoformat(datetime_str.replace('Z', '+00:00'))
-            return dt.strftime("%d/%m/%Y %H:%M")
-        except:
-            return datetime_str
+        # La caché vive en utils.ui_components: este script se re-ejecuta en cada rerun
+        if isinstance(datetime_str, datetime):
+            datetime_str = datetime_str.isoformat()
+        return format_datetime_display(datetime_str, fmt)
 
 def main():
     """Función principal"""
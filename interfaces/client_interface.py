@@ -5,14 +5,15 @@ Proporciona chat interactivo, carga de imágenes y visualización de cotizacione
 
 import streamlit as st
 import asyncio
+import queue
+import threading
+import time
 import uuid
 from datetime import datetime
 from typing import Dict, Any, Optional
-import base64
-from PIL import Image
-import io
 
 from agents.orchestrator import AgentOrchestrator
+from agents.base_agent import image_store
 from services.rag_service import rag_service
 from utils.config import config
 from utils.logging_config import get_logger
@@ -23,13 +24,75 @@ from utils.ui_components import (
     render_metric_card,
     render_status_badge, 
     render_modern_alert,
-    render_chat_message,
+    build_chat_message_html,
     render_section_divider,
-    render_status_indicator_professional
+    render_status_indicator_professional,
+    format_datetime_display
 )
 
 logger = get_logger("client_interface")
 
+# Sondeo adaptativo de mensajes del asesor (segundos)
+POLL_MIN_INTERVAL = 1.0
+POLL_MAX_INTERVAL = 30.0
+POLL_BACKOFF = 1.6
+SYNC_HEARTBEAT = 60.0  # Respaldo con Sync desactivado
+REARM_FACTOR = 2.0  # Rearmar el fragmento cuando el intervalo supera este múltiplo del armado
+DEBOUNCE_SECONDS = 0.5  # Ventana anti-rebote del botón de sincronización manual
+RERUN_THROTTLE_SECONDS = 0.25  # Separación mínima entre reruns completos
+STREAM_POLL_SECONDS = 0.5  # Espera por evento del stream antes de comprobar si el pump sigue vivo
+
+CHAT_PAGE_SIZE = 50  # Mensajes visibles; el resto se pagina con "Mostrar anteriores"
+MAX_SESSION_IMAGES = 3  # Imágenes recientes que conserva cada sesión
+
+# Footer estático: separador y texto en un solo elemento, fuera del fragmento de mensajes
+FOOTER_HTML = (
+    "<hr>"
+    "<div style='text-align: center; color: #666; font-size: 0.8em;'>"
+    "Seguros Sura Colombia - Asistente IA | Versión 1.0<br>"
+    "Para soporte técnico: soporte.ia@sura.com.co"
+    "</div>"
+)
+
+# Preguntas frecuentes del sidebar
+EXAMPLE_QUESTIONS = (
+    "¿Qué cubre el Plan Autos Básico?",
+    "¿Cuál es el deducible para daños por hurto?",
+    "¿Qué incluye la asistencia de pequeños eventos?",
+    "Quiero cotizar mi vehículo",
+    "¿En qué ciudades aplica la asistencia?"
+)
+
+# Estado propio de una conversación, que se descarta al iniciar una nueva sesión
+SESSION_KEYS_TO_RESET = (
+    "session_id", "messages", "message_index", "current_quotation",
+    "user_context", "last_seen_advisor_ts", "image_blobs", "chat_history_limit"
+)
+
+# Palabras clave que marcan un mensaje como cotización
+QUOTE_KEYS = ("cotización", "prima anual", "prima mensual")
+
+@st.cache_resource
+def _get_event_loop() -> asyncio.AbstractEventLoop:
+    """
+    Event loop persistente en un hilo propio, compartido por todas las sesiones.
+    
+    A diferencia de asyncio.run no se crea ni destruye un loop por mensaje, y los
+    clientes HTTP del orquestador conservan sus conexiones entre llamadas.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name="client-event-loop", daemon=True).start()
+    return loop
+
+def _submit(coro):
+    """Programa una corrutina en el event loop persistente; devuelve un Future concurrente"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_event_loop())
+
+@st.cache_resource(ttl=300, show_spinner=False)
+def _cached_rag_health() -> Dict[str, Any]:
+    """Salud del RAG compartida entre sesiones; evita consultar el vector store en cada carga"""
+    return rag_service.health_check()
+
 class ClientInterface:
     """Interfaz principal para clientes"""
     
@@ -56,6 +119,12 @@ class ClientInterface:
         if "messages" not in st.session_state:
             st.session_state.messages = []
         
+        if "message_index" not in st.session_state:
+            # Claves (timestamp, contenido) de los mensajes mostrados, para deduplicar en O(1)
+            st.session_state.message_index = {
+                self._message_key(message) for message in st.session_state.messages
+            }
+        
         if "current_quotation" not in st.session_state:
             st.session_state.current_quotation = None
         
@@ -67,36 +136,17 @@ class ClientInterface:
         
         if "auto_refresh" not in st.session_state:
             st.session_state.auto_refresh = True
+        
+        if "poll_interval" not in st.session_state:
+            st.session_state.poll_interval = POLL_MIN_INTERVAL
+            st.session_state.last_activity_ts = time.time()
     
     def run(self):
         """Ejecuta la interfaz principal"""
         
-        # SINCRONIZACIÓN AUTOMÁTICA - MEJORADA
-        if st.session_state.auto_refresh:
-            import time
-            if not hasattr(st.session_state, 'last_auto_check'):
-                st.session_state.last_auto_check = time.time()
-            
-            # Auto-check cada 3 segundos para mejor responsividad
-            if time.time() - st.session_state.last_auto_check > 3:
-                st.session_state.last_auto_check = time.time()
-                # Verificación para mensajes del asesor
-                new_advisor_messages = self._check_for_advisor_messages_only()
-                if new_advisor_messages:
-                    st.rerun()
-                    
-        # Auto-refresh independiente del checkbox (cada 10 segundos como fallback)
-        import time
-        if not hasattr(st.session_state, 'last_fallback_check'):
-            st.session_state.last_fallback_check = time.time()
-        
-        if time.time() - st.session_state.last_fallback_check > 10:
-            st.session_state.last_fallback_check = time.time()
-            # Check menos frecuente como respaldo
-            new_messages = self._check_for_advisor_messages_only()
-            if new_messages:
-                st.rerun()
-            
+        # La sincronización con el asesor vive en el fragmento de mensajes
+        # (_render_chat_messages) que el servidor re-ejecuta por temporizador
+        
         # AUTO-RERUN si es necesario (técnica profesional para forms)
         if st.session_state.get('should_rerun', False):
             st.session_state.should_rerun = False
@@ -133,23 +183,33 @@ class ClientInterface:
         """Inicializa sistemas necesarios"""
         with st.spinner("Inicializando sistema..."):
             try:
+                # Salud del orquestador y sesión en BD se consultan en paralelo en el
+                # loop persistente mientras este hilo verifica el RAG (su caché de
+                # Streamlit necesita el contexto del script)
+                prefetch = _submit(self._prefetch_boot_state(st.session_state.session_id))
+                
                 # Inicializar RAG si es necesario
-                rag_health = rag_service.health_check()
+                rag_health = _cached_rag_health()
+                
+                system_health, session = prefetch.result()
                 
                 if rag_health["vector_store_docs"] == 0:
                     st.info("Cargando base de conocimientos...")
                     rag_service.initialize_documents()
+                    # El conteo en caché quedó obsoleto tras la carga
+                    _cached_rag_health.clear()
                 
                 # Verificar salud del sistema
-                system_health = self.orchestrator.get_system_health()
+                if isinstance(system_health, Exception):
+                    raise system_health
                 
                 if system_health.get("orchestrator") == "healthy":
                     st.session_state.system_initialized = True
                     
                     # Crear sesión en la base de datos si no existe
                     try:
-                        from utils.database import db_manager
-                        session = db_manager.get_session(st.session_state.session_id)
+                        if isinstance(session, Exception):
+                            raise session
                         if not session:
                             db_manager.create_session(
                                 session_id=st.session_state.session_id,
@@ -166,7 +226,7 @@ class ClientInterface:
                         "timestamp": datetime.now().isoformat()
                     }
                     
-                    st.session_state.messages.append(welcome_message)
+                    self._append_message(welcome_message)
                 else:
                     st.error("Error inicializando sistema. Por favor recarga la página.")
                 
@@ -174,41 +234,110 @@ class ClientInterface:
                 self.logger.error(f"Error inicializando sistema: {str(e)}")
                 st.error("Error inicializando sistema. Por favor verifica la configuración.")
     
+    def _schedule_rerun(self):
+        """
+        Rerun completo con throttle: como mucho uno cada RERUN_THROTTLE_SECONDS
+        
+        Uno pedido antes de tiempo espera lo que falta de la ventana y se ejecuta; dejarlo
+        para el siguiente tick del fragmento podía tardar todo el intervalo de sondeo.
+        """
+        wait = RERUN_THROTTLE_SECONDS - (time.time() - st.session_state.get("last_rerun_ts", 0.0))
+        if wait > 0:
+            time.sleep(wait)
+        st.session_state.last_rerun_ts = time.time()
+        st.rerun()
+    
+    async def _prefetch_boot_state(self, session_id: str):
+        """Consultas independientes del arranque; los errores se devuelven, no se lanzan"""
+        return await asyncio.gather(
+            asyncio.to_thread(self.orchestrator.get_system_health),
+            asyncio.to_thread(db_manager.get_session, session_id),
+            return_exceptions=True
+        )
+    
     def _render_chat_interface(self):
         """Renderiza interfaz de chat principal"""
         st.subheader("💬 Conversación")
         
-        # Contenedor de mensajes
-        messages_container = st.container()
-        
-        with messages_container:
-            for message in st.session_state.messages:
-                self._render_message(message)
+        # Sondeo de mensajes del asesor: rápido con Sync, latido lento como respaldo.
+        # run_every solo se lee al registrar el fragmento en un run completo
+        run_every = st.session_state.poll_interval if st.session_state.auto_refresh else SYNC_HEARTBEAT
+        st.session_state.armed_poll_interval = run_every
+        st.fragment(self._render_chat_messages, run_every=run_every)()
         
         # Input del usuario
         self._render_user_input()
     
-    def _render_message(self, message: Dict[str, Any]):
-        """Renderiza un mensaje individual con diseño profesional"""
-        role = message["role"]
-        content = message["content"]
-        timestamp = message.get("timestamp", "")
+    def _render_chat_messages(self):
+        """
+        Lista de mensajes más sondeo del asesor, como fragmento con auto-refresh:
+        un mensaje nuevo solo re-ejecuta este sub-árbol, no toda la página
+        """
+        self._poll_advisor_messages()
         
-        # Usar componente profesional de chat
-        if timestamp:
-            timestamp_str = self._format_timestamp(timestamp)
-        else:
-            timestamp_str = None
+        messages = st.session_state.messages
+        limit = st.session_state.get("chat_history_limit", CHAT_PAGE_SIZE)
+        hidden = len(messages) - limit
+        
+        if hidden > 0 and st.button(f"⬆️ Mostrar anteriores ({hidden})", key="show_older_messages"):
+            st.session_state.chat_history_limit = limit + CHAT_PAGE_SIZE
+            st.rerun(scope="fragment")
+        
+        # Un solo st.markdown por tramo; solo los tips de cotización lo interrumpen
+        html_parts = []
+        for message in messages[-limit:]:
+            html_parts.append(self._build_message_html(message))
             
-        render_chat_message(content, role, timestamp_str)
-                
-                # Mostrar información adicional si es cotización
-        if role == "assistant" and self._is_quotation_message(message):
-                    self._render_quotation_details(message)
+            # Mostrar información adicional si es cotización
+            if message["role"] == "assistant" and self._is_quotation_message(message):
+                st.markdown("\n".join(html_parts), unsafe_allow_html=True)
+                html_parts = []
+                self._render_quotation_details(message)
+        
+        if html_parts:
+            st.markdown("\n".join(html_parts), unsafe_allow_html=True)
+    
+    def _poll_advisor_messages(self):
+        """Consulta mensajes del asesor cuando vence el intervalo adaptativo"""
+        interval = st.session_state.poll_interval if st.session_state.auto_refresh else SYNC_HEARTBEAT
+        now = time.time()
+        
+        # Los reruns completos también pasan por aquí: solo se consulta al vencer el intervalo
+        if now - st.session_state.get("last_auto_check", 0.0) < interval * 0.9:
+            return
+        
+        st.session_state.last_auto_check = now
+        
+        if self._check_for_advisor_messages_only():
+            # Actividad: volver al sondeo rápido
+            st.session_state.poll_interval = POLL_MIN_INTERVAL
+            if st.session_state.auto_refresh and st.session_state.get("armed_poll_interval", 0.0) > POLL_MIN_INTERVAL:
+                # El temporizador quedó armado con un intervalo lento: un run completo lo rearma
+                self._schedule_rerun()
+            return
+        
+        # Sin novedades: retroceso geométrico hasta el máximo
+        st.session_state.poll_interval = min(POLL_MAX_INTERVAL, st.session_state.poll_interval * POLL_BACKOFF)
+        
+        armed = st.session_state.get("armed_poll_interval", 0.0)
+        if st.session_state.auto_refresh and st.session_state.poll_interval >= armed * REARM_FACTOR:
+            # El temporizador sigue armado rápido: sin rearmar, cada tick redibuja el historial
+            self._schedule_rerun()
+    
+    def _build_message_html(self, message: Dict[str, Any]) -> str:
+        """Construye el HTML de un mensaje individual con diseño profesional"""
+        timestamp = message.get("timestamp", "")
+        timestamp_str = self._format_timestamp(timestamp) if timestamp else None
+        
+        return build_chat_message_html(message["content"], message["role"], timestamp_str)
     
     def _render_user_input(self):
         """Renderiza área de input del usuario"""
         
+        # Controles fuera de los forms para que funcionen; se pintan una sola vez
+        # para ambos métodos de entrada
+        self._render_sync_controls()
+        
         # Opciones de entrada
         input_method = st.radio(
             "Método de entrada:",
@@ -221,21 +350,21 @@ class ClientInterface:
         else:
             self._render_image_input()
     
-    def _render_text_input(self):
-        """Renderiza input de solo texto"""
-        
-        # Controles fuera del form para que funcionen
+    def _render_sync_controls(self):
+        """Controles de sincronización (Sync, Reiniciar, 🔄) con anti-rebote"""
         col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
+        now = time.time()
         
         with col1:
-            auto_sync = st.checkbox("Sync", value=st.session_state.auto_refresh, help="Sincronización automática")
-            if auto_sync != st.session_state.auto_refresh:
-                st.session_state.auto_refresh = auto_sync
-                if auto_sync:
-                    st.success("🔄 Sync activado")
-                else:
-                    st.info("⏸️ Sync desactivado")
-                st.rerun()
+            # El callback corre antes del rerun: el fragmento de mensajes, que se
+            # registra antes que estos controles, ya se arma con el nuevo valor
+            st.checkbox(
+                "Sync",
+                value=st.session_state.auto_refresh,
+                key="sync_toggle",
+                help="Sincronización automática",
+                on_change=self._toggle_auto_refresh
+            )
         
         with col2:
             if st.button("Reiniciar", help="Nueva sesión"):
@@ -243,12 +372,22 @@ class ClientInterface:
                 
         with col3:
             if st.button("🔄", help="Sincronizar ahora"):
-                new_messages = self._check_for_advisor_messages_only()
-                if new_messages:
-                    st.success("✅ Mensajes sincronizados")
-                else:
-                    st.info("📡 Sin mensajes nuevos")
-                st.rerun()
+                # Clics repetidos dentro de la ventana no vuelven a consultar la BD
+                if now - st.session_state.get("last_manual_sync_ts", 0.0) >= DEBOUNCE_SECONDS:
+                    st.session_state.last_manual_sync_ts = now
+                    if self._check_for_advisor_messages_only():
+                        # Los mensajes nuevos se pintan arriba: hace falta re-ejecutar
+                        self._schedule_rerun()
+                    else:
+                        st.info("📡 Sin mensajes nuevos")
+    
+    def _toggle_auto_refresh(self):
+        """Callback del checkbox Sync"""
+        st.session_state.auto_refresh = st.session_state.sync_toggle
+        st.toast("🔄 Sync activado" if st.session_state.auto_refresh else "⏸️ Sync desactivado")
+    
+    def _render_text_input(self):
+        """Renderiza input de solo texto"""
         
         # Form solo para el input y envío
         with st.form("text_input_form", clear_on_submit=True):
@@ -266,32 +405,6 @@ class ClientInterface:
     def _render_image_input(self):
         """Renderiza input con imagen y texto"""
         
-        # Controles fuera del form para que funcionen (igual que texto)
-        col1, col2, col3, col4 = st.columns([1, 1, 1, 1])
-        
-        with col1:
-            auto_sync = st.checkbox("Sync", value=st.session_state.auto_refresh, help="Sincronización automática")
-            if auto_sync != st.session_state.auto_refresh:
-                st.session_state.auto_refresh = auto_sync
-                if auto_sync:
-                    st.success("🔄 Sync activado")
-                else:
-                    st.info("⏸️ Sync desactivado")
-                st.rerun()
-        
-        with col2:
-            if st.button("Reiniciar", help="Nueva sesión"):
-                self._start_new_session()
-                
-        with col3:
-            if st.button("🔄", help="Sincronizar ahora"):
-                new_messages = self._check_for_advisor_messages_only()
-                if new_messages:
-                    st.success("✅ Mensajes sincronizados")
-                else:
-                    st.info("📡 Sin mensajes nuevos")
-                st.rerun()
-        
         # Form para imagen y texto
         with st.form("image_input_form", clear_on_submit=True):
             uploaded_file = st.file_uploader(
@@ -332,7 +445,11 @@ class ClientInterface:
             if image_data:
                 user_message["has_image"] = True
 
-            st.session_state.messages.append(user_message)
+            self._append_message(user_message)
+            
+            # Tras un envío la respuesta del asesor puede llegar pronto: sondeo rápido
+            st.session_state.poll_interval = POLL_MIN_INTERVAL
+            st.session_state.last_activity_ts = time.time()
             
             # NO guardar mensaje aquí - el orquestador lo hará
             # Evita duplicación en la BD
@@ -353,7 +470,7 @@ class ClientInterface:
                 
                 st.info("🧑‍💼 **Tu asesor humano está atendiendo tu consulta**")
                 st.markdown("💬 *Tu mensaje ha sido enviado al asesor. Recibirás respuesta pronto.*")
-                st.rerun()
+                self._schedule_rerun()
                 return
             
             # Preparar contexto
@@ -361,18 +478,11 @@ class ClientInterface:
             
             if image_data:
                 context_data["has_image"] = True
-                context_data["image_data"] = image_data
-            
-            # Procesar con orquestador
-            with st.spinner("Procesando..."):
-                response = asyncio.run(
-                    self.orchestrator.process_user_input(
-                        session_id=st.session_state.session_id,
-                        user_input=user_input,
-                        user_type="client",
-                        context_data=context_data
-                    )
-                )
+                # Solo la referencia viaja en el contexto, no los bytes
+                context_data["image_ref"] = self._store_image(image_data)
+            
+            # Procesar con orquestador mostrando los tokens a medida que llegan
+            response = self._stream_orchestrator_response(user_input, context_data)
             
             # Procesar respuesta
             if response["success"]:
@@ -384,7 +494,7 @@ class ClientInterface:
                     "metadata": response.get("metadata", {})
                 }
                 
-                st.session_state.messages.append(assistant_message)
+                self._append_message(assistant_message)
                 
                 # Actualizar contexto si es necesario
                 if "context" in response:
@@ -402,32 +512,106 @@ class ClientInterface:
                 st.error(f"Error: {response.get('error', 'Error desconocido')}")
             
             # Rerun para actualizar interfaz
-            st.rerun()
+            self._schedule_rerun()
             
         except Exception as e:
             self.logger.error(f"Error procesando entrada: {str(e)}")
             st.error("😅 **¡Ups!** Hubo un problema momentáneo. Reformula tu consulta o escribe 'hablar con asesor' para ayuda inmediata.")
     
+    def _store_image(self, image_data: bytes) -> str:
+        """Guarda la imagen en el almacén compartido conservando solo las últimas de la sesión"""
+        blob_id = image_store.put(image_data)
+        
+        image_blobs = st.session_state.setdefault("image_blobs", [])
+        image_blobs.append(blob_id)
+        while len(image_blobs) > MAX_SESSION_IMAGES:
+            image_store.discard(image_blobs.pop(0))
+        
+        return blob_id
+    
+    def _stream_orchestrator_response(self, user_input: str, context_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Consume orchestrator.stream_user_input desde el loop persistente y pinta los
+        tokens en un placeholder; devuelve la respuesta final del orquestador.
+        
+        Las llamadas a Streamlit deben hacerse desde el hilo del script, por eso los
+        eventos cruzan de hilo mediante una cola.
+        """
+        events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        # session_state solo existe en el hilo del script: se lee antes de pasar al loop
+        session_id = st.session_state.session_id
+        
+        async def pump():
+            try:
+                async for event in self.orchestrator.stream_user_input(
+                    session_id=session_id,
+                    user_input=user_input,
+                    user_type="client",
+                    context_data=context_data
+                ):
+                    events.put(event)
+            finally:
+                events.put(None)
+        
+        future = _submit(pump())
+        placeholder = st.empty()
+        placeholder.markdown("⏳ *Procesando...*")
+        
+        chunks = []
+        response = None
+        
+        while True:
+            try:
+                event = events.get(timeout=STREAM_POLL_SECONDS)
+            except queue.Empty:
+                # El pump pudo morir sin dejar el centinela (loop detenido, cancelación)
+                if future.done():
+                    break
+                continue
+            if event is None:
+                break
+            if event["type"] == "token":
+                chunks.append(event["content"])
+                placeholder.markdown("".join(chunks) + "▌")
+            else:
+                response = event["response"]
+        
+        placeholder.empty()
+        
+        # Si el pump falló o terminó sin evento final se responde con el fallback del orquestador
+        try:
+            future.result(timeout=STREAM_POLL_SECONDS)
+        except Exception as e:
+            self.logger.error(f"Error en el stream del orquestador: {str(e)}")
+            return self.orchestrator._error_response(session_id, e)
+        
+        if response is None:
+            return self.orchestrator._error_response(session_id, RuntimeError("Stream sin respuesta final"))
+        
+        return response
+    
     def _process_image_input(self, uploaded_file, user_input: str):
         """Procesa entrada con imagen SIN duplicación"""
         try:
-            # Leer imagen
-            image_bytes = uploaded_file.read()
-            
-            # Validar tamaño
-            if len(image_bytes) > 10 * 1024 * 1024:  # 10MB
+            # Validar tamaño sin leer el archivo
+            if uploaded_file.size > 10 * 1024 * 1024:  # 10MB
                 st.warning("La imagen es muy grande. Por favor sube una imagen menor a 10MB.")
                 return
             
-            # Mostrar preview SOLO si no está ya en mensajes
+            # Mostrar preview SOLO si no está ya en mensajes (si no, ni se lee ni se decodifica)
             existing_images = [msg for msg in st.session_state.messages if msg.get("has_image")]
             if len(existing_images) == 0 or not any("[Imagen de vehículo subida]" in msg.get("content", "") for msg in existing_images[-2:]):
-                image = Image.open(io.BytesIO(image_bytes))
+                from PIL import Image
+                
+                # draft() hace que libjpeg decodifique directamente a resolución reducida
+                image = Image.open(uploaded_file)
+                image.draft("RGB", (400, 400))
+                image.thumbnail((200, 200))
                 st.image(image, caption="Imagen subida", width=200)
                 
-                # Procesar SOLO una vez
+                # Procesar SOLO una vez; getvalue() expone el buffer sin otra lectura
                 combined_input = f"[Imagen de vehículo subida] {user_input}" if user_input else "[Imagen de vehículo subida]"
-                self._process_user_input(combined_input, image_bytes)
+                self._process_user_input(combined_input, uploaded_file.getvalue())
             
         except Exception as e:
             self.logger.error(f"Error procesando imagen: {str(e)}")
@@ -441,12 +625,11 @@ class ClientInterface:
         st.markdown(f"**ID:** `{st.session_state.session_id[:8]}...`")
         st.markdown(f"**Mensajes:** `{len(st.session_state.messages)}`")
         
-        # Solo mostrar estado si auto-refresh está activado
-        if st.session_state.auto_refresh:
-            import time
-            last_check = getattr(st.session_state, 'last_auto_check', time.time())
-            seconds_ago = int(time.time() - last_check)
-            render_modern_alert(f"🔄 Sync activo (último: {seconds_ago}s)", "success")
+        if st.button("♻️ Forzar recarga", help="Vuelve a verificar la base de conocimientos"):
+            _cached_rag_health.clear()
+            st.toast("Estado del sistema se verificará de nuevo")
+        
+        self._render_sync_status()
         
         # Cotización actual
         if st.session_state.current_quotation:
@@ -458,6 +641,16 @@ class ClientInterface:
         # Contacto de emergencia
         self._render_emergency_contact()
     
+    def _render_sync_status(self):
+        """Muestra el estado del sondeo (se actualiza en cada run completo)"""
+        # Solo mostrar estado si auto-refresh está activado
+        if st.session_state.auto_refresh:
+            seconds_ago = int(time.time() - st.session_state.get("last_auto_check", time.time()))
+            render_modern_alert(
+                f"🔄 Sync activo (último: {seconds_ago}s, cada {st.session_state.poll_interval:.0f}s)",
+                "success"
+            )
+    
     def _render_quotation_summary(self):
         """Renderiza resumen de cotización actual"""
         quotation = st.session_state.current_quotation
@@ -478,16 +671,8 @@ class ClientInterface:
     def _render_example_questions(self):
         """Renderiza preguntas de ejemplo"""
         with st.expander("❓ Preguntas Frecuentes", expanded=False):
-            examples = [
-                "¿Qué cubre el Plan Autos Básico?",
-                "¿Cuál es el deducible para daños por hurto?",
-                "¿Qué incluye la asistencia de pequeños eventos?",
-                "Quiero cotizar mi vehículo",
-                "¿En qué ciudades aplica la asistencia?"
-            ]
-            
-            for example in examples:
-                if st.button(f"💬 {example}", key=f"example_{hash(example)}"):
+            for i, example in enumerate(EXAMPLE_QUESTIONS):
+                if st.button(f"💬 {example}", key=f"example_q_{i}"):
                     self._process_user_input(example)
     
     def _render_emergency_contact(self):
@@ -511,16 +696,18 @@ class ClientInterface:
             """)
     
     def _is_quotation_message(self, message: Dict[str, Any]) -> bool:
-        """Verifica si un mensaje contiene información de cotización"""
+        """Verifica si un mensaje contiene información de cotización (marca calculada al agregarlo)"""
+        if "_is_quote" not in message:
+            message["_is_quote"] = self._detect_quotation(message)
+        return message["_is_quote"]
+    
+    @staticmethod
+    def _detect_quotation(message: Dict[str, Any]) -> bool:
+        """Escanea el contenido una sola vez en busca de información de cotización"""
+        if (message.get("metadata") or {}).get("quotation"):
+            return True
         content = message.get("content", "").lower()
-        metadata = message.get("metadata", {})
-        
-        return (
-            "cotización" in content or 
-            "prima anual" in content or 
-            "prima mensual" in content or
-            metadata.get("quotation")
-        )
+        return any(key in content for key in QUOTE_KEYS)
     
     def _render_quotation_details(self, message: Dict[str, Any]):
         """Renderiza detalles de cotización en un mensaje"""
@@ -537,26 +724,35 @@ class ClientInterface:
     
     def _start_new_session(self):
         """Inicia una nueva sesión"""
-        # Limpiar estado
-        for key in list(st.session_state.keys()):
-            if key not in ["system_initialized"]:
-                del st.session_state[key]
+        # Liberar las imágenes de la sesión anterior
+        for blob_id in st.session_state.get("image_blobs", []):
+            image_store.discard(blob_id)
+        
+        # Limpiar solo el estado de la conversación; widgets, sondeo y
+        # system_initialized se conservan
+        for key in SESSION_KEYS_TO_RESET:
+            st.session_state.pop(key, None)
         
         st.session_state.session_id = str(uuid.uuid4())
-        st.session_state.messages = []
-        st.session_state.current_quotation = None
-        st.session_state.user_context = {}
-        st.session_state.auto_refresh = True
+        self._initialize_session_state()
         
         st.rerun()
     
+    @staticmethod
+    def _message_key(message: Dict[str, Any]) -> tuple:
+        """Clave de deduplicación de un mensaje del chat"""
+        return (message.get("timestamp"), message.get("content"))
+    
+    def _append_message(self, message: Dict[str, Any]):
+        """Agrega un mensaje al chat manteniendo el índice de deduplicación"""
+        if message.get("role") == "assistant":
+            message["_is_quote"] = self._detect_quotation(message)
+        st.session_state.messages.append(message)
+        st.session_state.message_index.add(self._message_key(message))
+    
     def _format_timestamp(self, timestamp_str: str) -> str:
-        """Formatea timestamp para display"""
-        try:
-            dt = datetime.fromisoformat(timestamp_str.replace('Z', '+00:00'))
-            return dt.strftime("%H:%M")
-        except:
-            return timestamp_str
+        """Formatea timestamp para display (memoizado en format_datetime_display)"""
+        return format_datetime_display(timestamp_str, "%H:%M")
     
     def _show_quotation_details(self):
         """Muestra detalles completos de cotización en modal"""
@@ -611,14 +807,12 @@ class ClientInterface:
                     msg_content = msg.content
                     
                     # Verificar duplicados por timestamp Y contenido (para TODOS los agentes)
-                    msg_already_exists = any(
-                        existing_msg.get("timestamp") == msg_timestamp and (
-                            # Para mensajes de asesor humano
-                            existing_msg.get("content", "").replace("👨‍💼 **Asesor:** ", "") == msg_content or
-                            # Para mensajes de sistema/agentes
-                            existing_msg.get("content", "") == msg_content
-                        )
-                        for existing_msg in st.session_state.messages
+                    message_index = st.session_state.message_index
+                    msg_already_exists = (
+                        # Para mensajes de asesor humano
+                        (msg_timestamp, f"👨‍💼 **Asesor:** {msg_content}") in message_index or
+                        # Para mensajes de sistema/agentes
+                        (msg_timestamp, msg_content) in message_index
                     )
                     
                     if msg_already_exists:
@@ -645,7 +839,7 @@ class ClientInterface:
                             "from_system": True
                         }
                     
-                    st.session_state.messages.append(system_message)
+                    self._append_message(system_message)
                 
                 # Notificación visual profesional (solo para mensajes de asesor humano)
                 advisor_count = len([msg for msg in new_messages_db if msg.agent_type == "human_advisor"])
@@ -666,48 +860,43 @@ class ClientInterface:
         NO incluye mensajes del orquestador (evita duplicados)
         """
         try:
-            # Obtener SOLO mensajes del asesor humano desde la BD
-            db_history = db_manager.get_conversation_history(st.session_state.session_id)
-            
-            # Filtrar ÚNICAMENTE mensajes del asesor humano
-            advisor_messages_db = [
-                msg for msg in db_history 
-                if msg.agent_type == "human_advisor"
-            ]
-            
-            # Obtener mensajes del asesor en la interfaz actual
-            current_advisor_messages = [
-                msg for msg in st.session_state.messages 
-                if msg.get("agent") == "human_advisor" or msg.get("from_advisor", False)
-            ]
+            last_seen = st.session_state.get("last_seen_advisor_ts")
+            
+            # Sonda de una fila: sin mensajes del asesor posteriores no se pide el delta
+            last_advisor_ts = db_manager.get_last_advisor_ts(st.session_state.session_id)
+            if last_advisor_ts is None or (last_seen is not None and last_advisor_ts <= last_seen):
+                return False
+            
+            # Solo los mensajes del asesor posteriores al último visto (consulta delta)
+            new_advisor_messages = db_manager.get_messages_since(
+                st.session_state.session_id,
+                last_seen,
+                agent_types=["human_advisor"]
+            )
             
-            # Si hay más mensajes del asesor en BD
-            if len(advisor_messages_db) > len(current_advisor_messages):
-                missing_count = len(advisor_messages_db) - len(current_advisor_messages)
-                new_advisor_messages = advisor_messages_db[-missing_count:]
+            if new_advisor_messages:
+                st.session_state.last_seen_advisor_ts = new_advisor_messages[-1].timestamp
+                
+                added = 0
                 
                 for msg in new_advisor_messages:
-                    # Verificar que no esté duplicado
-                    msg_timestamp = msg.timestamp.isoformat()
-                    msg_already_exists = any(
-                        existing_msg.get("timestamp") == msg_timestamp
-                        for existing_msg in st.session_state.messages
-                    )
+                    advisor_message = {
+                        "role": "assistant",
+                        "content": f"👨‍💼 **Asesor:** {msg.content}",
+                        "timestamp": msg.timestamp.isoformat(),
+                        "agent": "human_advisor",
+                        "metadata": msg.metadata,
+                        "from_advisor": True
+                    }
                     
-                    if not msg_already_exists:
+                    # Verificar que no esté duplicado
+                    if self._message_key(advisor_message) not in st.session_state.message_index:
                         # Agregar SOLO mensaje del asesor
-                        advisor_message = {
-                            "role": "assistant",
-                            "content": f"👨‍💼 **Asesor:** {msg.content}",
-                            "timestamp": msg_timestamp,
-                            "agent": "human_advisor",
-                            "metadata": msg.metadata,
-                            "from_advisor": True
-                        }
-                        st.session_state.messages.append(advisor_message)
+                        self._append_message(advisor_message)
+                        added += 1
                 
-                if new_advisor_messages:
-                    st.success(f"💬 {len(new_advisor_messages)} nuevo(s) mensaje(s) de tu asesor")
+                if added:
+                    st.success(f"💬 {added} nuevo(s) mensaje(s) de tu asesor")
                     return True
             
             return False
@@ -717,14 +906,8 @@ class ClientInterface:
             return False
     
     def _render_footer(self):
-        """Renderiza footer de la aplicación"""
-        st.markdown("---")
-        st.markdown("""
-        <div style='text-align: center; color: #666; font-size: 0.8em;'>
-            Seguros Sura Colombia - Asistente IA | Versión 1.0<br>
-            Para soporte técnico: soporte.ia@sura.com.co
-        </div>
-        """, unsafe_allow_html=True)
+        """Renderiza footer de la aplicación (un solo elemento estático)"""
+        st.markdown(FOOTER_HTML, unsafe_allow_html=True)
 
 def main():
     """Función principal"""
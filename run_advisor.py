@@ -6,6 +6,7 @@ Configura el entorno y ejecuta Streamlit con la configuración correcta.
 import os
 import sys
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Agregar el directorio raíz al path
@@ -30,10 +31,18 @@ def setup_environment():
     os.environ.setdefault("ADVISOR_PORT", "8502")
     os.environ.setdefault("EXPEDITION_API_URL", "http://localhost:8000")
 
+def _probe(package, description):
+    """Intenta importar un paquete y retorna (descripción, disponible)"""
+    try:
+        __import__(package)
+        return description, True
+    except ImportError:
+        return description, False
+
 def check_dependencies():
     """Verifica que las dependencias estén instaladas"""
     required_packages = {
-        'streamlit': 'streamlit>=1.29.0',
+        'streamlit': 'streamlit>=1.37.0',
         'pandas': 'pandas (para tablas)',
         'langchain': 'langchain (para agentes)',
         'sqlite3': 'sqlite3 (built-in)'
@@ -41,16 +50,15 @@ def check_dependencies():
     
     missing_packages = []
     
-    for package, description in required_packages.items():
-        try:
-            if package == 'sqlite3':
-                import sqlite3
+    # Las sondas de importación corren en paralelo; map conserva el orden de impresión
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = executor.map(lambda item: _probe(*item), required_packages.items())
+        for description, ok in results:
+            if ok:
+                print(f"✅ {description}")
             else:
-                __import__(package)
-            print(f"✅ {description}")
-        except ImportError:
-            missing_packages.append(description)
-            print(f"❌ {description}")
+                missing_packages.append(description)
+                print(f"❌ {description}")
     
     if missing_packages:
         print(f"\n🔧 Para instalar dependencias faltantes:")
@@ -104,6 +112,16 @@ def main():
     print("📋 Credenciales demo: cualquier ID con contraseña 'admin123'")
     print("=" * 50)
     
+    if os.name == "posix":
+        # Reemplaza este proceso por Streamlit: no queda un padre esperando
+        sys.stdout.flush()
+        os.chdir(project_root)
+        try:
+            os.execvp(streamlit_cmd[0], streamlit_cmd)
+        except OSError as e:
+            print(f"❌ Error ejecutando aplicación: {e}")
+            sys.exit(1)
+    
     try:
         subprocess.run(streamlit_cmd, cwd=str(project_root))
     except KeyboardInterrupt:
@@ -6,12 +6,16 @@ Configura el entorno y ejecuta Streamlit con la configuración correcta.
 import os
 import sys
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Agregar el directorio raíz al path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+# Proceso de la API de expedición si lo inició este script
+_api_process = None
+
 def setup_environment():
     """Configura variables de entorno necesarias"""
     
@@ -31,10 +35,19 @@ def setup_environment():
     os.environ.setdefault("CLIENT_PORT", "8501")
     os.environ.setdefault("EXPEDITION_API_URL", "http://localhost:8000")
 
+def _probe(package, description):
+    """Intenta importar un paquete y retorna (descripción, disponible)"""
+    try:
+        # PIL no expone Image al importar el paquete raíz
+        __import__("PIL.Image" if package == 'PIL' else package)
+        return description, True
+    except ImportError:
+        return description, False
+
 def check_dependencies():
     """Verifica que las dependencias estén instaladas"""
     required_packages = {
-        'streamlit': 'streamlit>=1.29.0',
+        'streamlit': 'streamlit>=1.37.0',
         'langchain': 'langchain>=0.1.0',
         'chromadb': 'chromadb>=0.4.0',
         'openai': 'openai (para Azure OpenAI)',
@@ -44,16 +57,15 @@ def check_dependencies():
     
     missing_packages = []
     
-    for package, description in required_packages.items():
-        try:
-            if package == 'PIL':
-                from PIL import Image
+    # Las sondas de importación corren en paralelo; map conserva el orden de impresión
+    with ThreadPoolExecutor(max_workers=6) as executor:
+        results = executor.map(lambda item: _probe(*item), required_packages.items())
+        for description, ok in results:
+            if ok:
+                print(f"✅ {description}")
             else:
-                __import__(package)
-            print(f"✅ {description}")
-        except ImportError:
-            missing_packages.append(description)
-            print(f"❌ {description}")
+                missing_packages.append(description)
+                print(f"❌ {description}")
     
     if missing_packages:
         print(f"\n🔧 Para instalar dependencias faltantes:")
@@ -66,6 +78,7 @@ def check_dependencies():
 
 def start_expedition_api():
     """Inicia la API de expedición si no está corriendo"""
+    global _api_process
     try:
         import requests
         response = requests.get("http://localhost:8000/", timeout=5)
@@ -76,8 +89,8 @@ def start_expedition_api():
         
         api_script = project_root / "services" / "expedition_api" / "app.py"
         if api_script.exists():
-            # Ejecutar en background
-            subprocess.Popen([
+            # Ejecutar en background (en Linux Popen ya lanza con vfork/posix_spawn)
+            _api_process = subprocess.Popen([
                 sys.executable, str(api_script)
             ], cwd=str(api_script.parent))
             print("✅ API de expedición iniciada en puerto 8000")
@@ -148,6 +161,17 @@ def main():
     print(f"🌐 Accede en: http://localhost:{client_port}")
     print("=" * 50)
     
+    # Reemplazar este proceso por Streamlit: no queda un padre esperando. Solo si no
+    # hay hijos propios: Streamlit no los recogería y quedarían zombis al terminar
+    if os.name == "posix" and _api_process is None:
+        sys.stdout.flush()
+        os.chdir(project_root)
+        try:
+            os.execvp(streamlit_cmd[0], streamlit_cmd)
+        except OSError as e:
+            print(f"❌ Error ejecutando aplicación: {e}")
+            sys.exit(1)
+    
     try:
         subprocess.run(streamlit_cmd, cwd=str(project_root))
     except KeyboardInterrupt:
@@ -1,15 +1,28 @@
 
+from __future__ import annotations
+
+import glob
+import hashlib
 import os
-import pandas as pd
+import time
 import unicodedata
-from typing import Optional
+from functools import lru_cache
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Mapping, Optional
+
+if TYPE_CHECKING:
+    # pandas se importa dentro de las funciones que lo usan: solo se paga al cargar el catálogo
+    import pandas as pd
 
 # === Tasas por plan (ajústalas a tu tarifario real) ===
-PLAN_RATES: dict[str, float] = {
+# Solo lectura: cotizar_poliza calcula los recargos sobre una copia local
+PLAN_RATES: Mapping[str, float] = MappingProxyType({
     "Plan Basico": 0.025,         # 2.5%
     "Plan Autos Clasico": 0.035,  # 3.5%
     "Plan Autos Global": 0.045,   # 4.5%
-}
+})
+
+RECARGO_COLOR_ROJO = 1.1  # +10% para vehículos rojos
 
 # ======= Estado interno (cache) =======
 _CATALOGO_DF: Optional[pd.DataFrame] = None
@@ -17,8 +30,17 @@ _CATALOGO_PATH: Optional[str] = None
 _CATALOGO_SHEET: Optional[str | int] = 0
 _CATALOGO_COLMAP: Optional[dict] = None
 _CATALOGO_MTIME: Optional[float] = None
+# Revisión de cambios del Excel acotada en el tiempo: a lo sumo un stat cada intervalo
+_MTIME_CHECK_INTERVAL = 5.0  # segundos
+_ULTIMA_REVISION_MTIME: float = 0.0
+# (marca, modelo, linea, clase) normalizados -> Valor, para cotizar sin recorrer el DataFrame
+_CATALOGO_INDEX: dict[tuple[str, str, str, str], float] = {}
+
+_NORM_COLS = ["Marca_norm", "Modelo_norm", "Linea_norm", "Clase_norm"]
 
 # ======= Utils =======
+# typed=True: 2012 y 2012.0 son iguales como claves de caché pero normalizan distinto
+@lru_cache(maxsize=8192, typed=True)
 def _norm(s: str) -> str:
     """Normaliza texto: quita acentos, colapsa espacios y pone en minúsculas."""
     if s is None:
@@ -29,11 +51,29 @@ def _norm(s: str) -> str:
     s = "".join(ch for ch in s if not unicodedata.combining(ch))
     return s.lower()
 
+# Bloques Unicode de marcas combinantes (lo que unicodedata.combining descarta en _norm)
+_COMBINING_RE = "[\u0300-\u036f\u1ab0-\u1aff\u1dc0-\u1dff\u20d0-\u20ff\ufe20-\ufe2f]"
+
+def _norm_series(s: pd.Series) -> pd.Series:
+    """Versión vectorizada de _norm para una columna completa (operaciones .str en C)."""
+    return (
+        s.astype(object)
+        .fillna("")
+        .astype(str)
+        .str.split()
+        .str.join(" ")
+        .str.normalize("NFKD")
+        .str.replace(_COMBINING_RE, "", regex=True)
+        .str.lower()
+    )
+
 def _canonizar_catalogo(df: pd.DataFrame, col_mappings: Optional[dict]) -> pd.DataFrame:
     """
     Estandariza nombres de columnas a: Marca, Modelo, Linea, Clase, Valor
     y agrega columnas *_norm para búsquedas robustas.
     """
+    import pandas as pd
+
     expected = ["Marca", "Modelo", "Linea", "Clase", "Valor"]  # <<< cambio clave
 
     if col_mappings is None:
@@ -65,7 +105,7 @@ def _canonizar_catalogo(df: pd.DataFrame, col_mappings: Optional[dict]) -> pd.Da
 
     # columnas normalizadas para filtro exacto robusto
     for col in ["Marca", "Modelo", "Linea", "Clase"]:
-        work[col + "_norm"] = work[col].apply(_norm)
+        work[col + "_norm"] = _norm_series(work[col])
 
     # asegurar que 'Valor' sea numérico
     if not pd.api.types.is_numeric_dtype(work["Valor"]):
@@ -75,9 +115,57 @@ def _canonizar_catalogo(df: pd.DataFrame, col_mappings: Optional[dict]) -> pd.Da
 
     return work
 
+def _ruta_cache(path: str, sheet: str | int, colmap: Optional[dict], mtime: float) -> str:
+    """Sidecar del catálogo ya canonizado, ligado al mtime del Excel y a la hoja/mapeo usados."""
+    config_key = hashlib.md5(repr((sheet, sorted((colmap or {}).items()))).encode()).hexdigest()[:8]
+    return f"{path}.{int(mtime)}.{config_key}.parquet"
+
 def _cargar_desde_archivo(path: str, sheet: str | int, colmap: Optional[dict]) -> pd.DataFrame:
-    df = pd.read_excel(path, sheet_name=sheet)
-    return _canonizar_catalogo(df, colmap)
+    """
+    Lee y canoniza el catálogo. read_excel (openpyxl) es lento, así que el resultado
+    se guarda en un parquet junto al Excel y se reutiliza mientras el archivo no cambie.
+    Parquet es solo datos (a diferencia de pickle, leerlo no ejecuta código) y requiere
+    pyarrow; sin pyarrow se lee siempre el Excel.
+    """
+    import pandas as pd
+
+    try:
+        import pyarrow  # noqa: F401  (motor de parquet, opcional)
+    except ImportError:
+        return _canonizar_catalogo(pd.read_excel(path, sheet_name=sheet), colmap)
+
+    cache_path = _ruta_cache(path, sheet, colmap, os.path.getmtime(path))
+    if os.path.isfile(cache_path):
+        try:
+            return pd.read_parquet(cache_path)
+        except Exception:
+            pass  # cache corrupto o ilegible: se regenera
+
+    df = _canonizar_catalogo(pd.read_excel(path, sheet_name=sheet), colmap)
+
+    try:
+        tmp_path = f"{cache_path}.tmp{os.getpid()}"
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path)
+        # borrar caches de versiones anteriores del Excel (incluidos los pickle antiguos)
+        for stale in glob.glob(glob.escape(path) + ".*.parquet") + glob.glob(glob.escape(path) + ".*.pkl"):
+            if stale != cache_path:
+                os.remove(stale)
+    except Exception:
+        pass  # sin permisos de escritura o columnas no serializables: se sigue sin cache
+
+    return df
+
+def _instalar_catalogo(df: pd.DataFrame):
+    """Publica el catálogo y su índice hash; ante claves duplicadas gana la primera fila."""
+    global _CATALOGO_DF, _CATALOGO_INDEX
+    unicos = df.drop_duplicates(subset=_NORM_COLS, keep="first")
+    # tolist() entrega float de Python: la cotización no pasa por escalares de numpy
+    _CATALOGO_INDEX = dict(zip(
+        zip(*(unicos[col] for col in _NORM_COLS)),
+        unicos["Valor"].to_numpy(dtype=float).tolist(),
+    ))
+    _CATALOGO_DF = df
 
 def _asegurar_catalogo_cargado():
     """
@@ -86,15 +174,20 @@ def _asegurar_catalogo_cargado():
     2) Si no existe config, intenta variable de entorno VEHICULOS_XLSX
     """
     global _CATALOGO_DF, _CATALOGO_PATH, _CATALOGO_SHEET, _CATALOGO_COLMAP, _CATALOGO_MTIME
+    global _ULTIMA_REVISION_MTIME
 
-    # Si ya está cargado, revisa si el archivo cambió
+    # Si ya está cargado, revisa si el archivo cambió (como mucho una vez por intervalo)
     if _CATALOGO_DF is not None and _CATALOGO_PATH:
+        ahora = time.monotonic()
+        if ahora - _ULTIMA_REVISION_MTIME < _MTIME_CHECK_INTERVAL:
+            return
+        _ULTIMA_REVISION_MTIME = ahora
         try:
             mtime = os.path.getmtime(_CATALOGO_PATH)
             if _CATALOGO_MTIME == mtime:
                 return  # sin cambios
             # recargar si cambió
-            _CATALOGO_DF = _cargar_desde_archivo(_CATALOGO_PATH, _CATALOGO_SHEET, _CATALOGO_COLMAP)
+            _instalar_catalogo(_cargar_desde_archivo(_CATALOGO_PATH, _CATALOGO_SHEET, _CATALOGO_COLMAP))
             _CATALOGO_MTIME = mtime
             return
         except FileNotFoundError:
@@ -120,8 +213,9 @@ def _asegurar_catalogo_cargado():
     if _CATALOGO_PATH:
         if not os.path.isfile(_CATALOGO_PATH):
             raise FileNotFoundError(f"No encontré el archivo: {_CATALOGO_PATH}")
-        _CATALOGO_DF = _cargar_desde_archivo(_CATALOGO_PATH, _CATALOGO_SHEET, _CATALOGO_COLMAP)
+        _instalar_catalogo(_cargar_desde_archivo(_CATALOGO_PATH, _CATALOGO_SHEET, _CATALOGO_COLMAP))
         _CATALOGO_MTIME = os.path.getmtime(_CATALOGO_PATH)
+        _ULTIMA_REVISION_MTIME = time.monotonic()
 
 def configurar_fuente_excel(
     excel_path: str,
@@ -133,14 +227,16 @@ def configurar_fuente_excel(
     Ej.: configurar_fuente_excel('/ruta/carros.xlsx', 0, {'Valor': 'VALOR_258'})
     """
     global _CATALOGO_DF, _CATALOGO_PATH, _CATALOGO_SHEET, _CATALOGO_COLMAP, _CATALOGO_MTIME
+    global _ULTIMA_REVISION_MTIME
     if not os.path.isfile(excel_path):
         raise FileNotFoundError(f"No encontré el archivo: {excel_path}")
 
     _CATALOGO_PATH = excel_path
     _CATALOGO_SHEET = sheet_name
     _CATALOGO_COLMAP = col_mappings
-    _CATALOGO_DF = _cargar_desde_archivo(excel_path, sheet_name, col_mappings)
+    _instalar_catalogo(_cargar_desde_archivo(excel_path, sheet_name, col_mappings))
     _CATALOGO_MTIME = os.path.getmtime(excel_path)
+    _ULTIMA_REVISION_MTIME = time.monotonic()
 
 def cotizar_poliza(
     marca: str,
@@ -148,32 +244,26 @@ def cotizar_poliza(
     linea: str,
     clase: str,
     color: str,
-    plan_rates: dict[str, float] = PLAN_RATES
+    plan_rates: Optional[Mapping[str, float]] = None
     ):
     """
     Cotiza una póliza de seguro para un vehículo.
 
+    plan_rates: tasas a aplicar (por defecto PLAN_RATES); nunca se modifican.
     """
 
-    if color == "ROJO":
-        # Aplicar un recargo del 10% para vehículos rojos
-        for plan in plan_rates:
-            plan_rates[plan] *= 1.1
+    # Recargo sobre una copia local: antes se multiplicaba PLAN_RATES en cada cotización roja
+    base_rates = PLAN_RATES if plan_rates is None else plan_rates
+    recargo = RECARGO_COLOR_ROJO if color == "ROJO" else 1.0
+    rates = {plan: rate * recargo for plan, rate in base_rates.items()}
 
     _asegurar_catalogo_cargado()
-    catalogo = _CATALOGO_DF
-
-    # Filtro exacto por columnas normalizadas
-    filt = (
-        (catalogo["Marca_norm"]  == _norm(marca)) &
-        (catalogo["Modelo_norm"] == _norm(modelo)) &
-        (catalogo["Linea_norm"]  == _norm(linea)) &
-        (catalogo["Clase_norm"]  == _norm(clase))
-    )
-    subset = catalogo.loc[filt]
 
-    if subset.empty:
-        ejemplos = catalogo[["Marca", "Modelo", "Linea", "Clase"]].head(10).to_dict(orient="records")
+    # Búsqueda exacta por claves normalizadas en el índice hash
+    valor_vehiculo = _CATALOGO_INDEX.get((_norm(marca), _norm(modelo), _norm(linea), _norm(clase)))
+
+    if valor_vehiculo is None:
+        ejemplos = _CATALOGO_DF[["Marca", "Modelo", "Linea", "Clase"]].head(10).to_dict(orient="records")
         raise ValueError(
             "No encontré coincidencias exactas con las 4 claves dadas.\n"
             f"Entrada: marca='{marca}', modelo='{modelo}', linea='{linea}', clase='{clase}'.\n"
@@ -181,13 +271,11 @@ def cotizar_poliza(
             f"{ejemplos}"
         )
 
-    # Si hay múltiples coincidencias, tomamos la primera (puedes cambiar esta regla)
-    row = subset.iloc[0]
-    valor_vehiculo = float(row["Valor"])
+    # Si hay múltiples coincidencias, el índice conserva la primera (ver _instalar_catalogo)
 
     # Calcular primas
     quotes: dict[str, dict[str, float]] = {}
-    for plan, rate in plan_rates.items():
+    for plan, rate in rates.items():
         anual = round(valor_vehiculo * rate, 2)
         mensual = round(anual / 12.0, 2)
         quotes[plan] = {
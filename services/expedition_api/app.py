@@ -1,10 +1,28 @@
 # app.py
 from flask import Flask, request, jsonify
-import random
+import os
+import itertools
 import json
+import threading
+import time
 from pathlib import Path
 from datetime import datetime
 
+try:
+    import orjson  # Serializador JSON en C (opcional)
+
+    def _dump_poliza(payload: dict) -> bytes:
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+
+    def _dump_poliza_legible(payload: dict) -> bytes:
+        return orjson.dumps(payload, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    def _dump_poliza(payload: dict) -> bytes:
+        return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def _dump_poliza_legible(payload: dict) -> bytes:
+        return json.dumps(payload, ensure_ascii=False, indent=2).encode("utf-8")
+
 app = Flask(__name__)
 
 REQUIRED_FIELDS = [
@@ -19,55 +37,157 @@ REQUIRED_FIELDS = [
     "valor_total_poliza",
     "valor_mensual",
 ]
+REQUIRED_FIELDS_SET = frozenset(REQUIRED_FIELDS)
 
 POLIZAS_DIR = Path(__file__).parent / "polizas"
 POLIZAS_DIR.mkdir(parents=True, exist_ok=True)
 
-@app.route("/expedir-poliza", methods=["POST"])
-def expedir_poliza():
-    if not request.is_json:
-        return jsonify({"error": "El cuerpo debe ser JSON"}), 400
+# Contador monotónico por proceso (next() es atómico bajo el GIL); arranca en la hora en ms
+_contador_polizas = itertools.count(int(time.time() * 1000))
 
-    data = request.get_json(silent=True) or {}
+# Registro agregado para consultas: todas las pólizas en un JSONL y un índice
+# de líneas "numero,offset,tamaño" que apunta a cada registro
+POLIZAS_JSONL = POLIZAS_DIR / "polizas.jsonl"
+POLIZAS_IDX = POLIZAS_DIR / "polizas.idx"
+_registro_lock = threading.Lock()
+
+# Números consecutivos a probar si el generado ya tiene archivo
+MAX_INTENTOS_NUMERO = 20
 
-    # Validaciones básicas
-    missing = [f for f in REQUIRED_FIELDS if f not in data]
+def _validar(data) -> dict:
+    """Retorna el detalle de errores de una solicitud (vacío si es válida)."""
+    if not isinstance(data, dict):
+        return {"error": "Cada póliza debe ser un objeto JSON"}
+
+    # Validaciones básicas (diferencia de conjuntos; la lista ordenada solo si falta algo)
+    missing_set = REQUIRED_FIELDS_SET - data.keys()
+    missing = [f for f in REQUIRED_FIELDS if f in missing_set] if missing_set else []
     non_string = [f for f in REQUIRED_FIELDS if f in data and not isinstance(data[f], str)]
 
     if missing or non_string:
-        return jsonify({
+        return {
             "error": "Datos inválidos",
             "faltantes": missing,
             "no_texto": non_string
-        }), 400
+        }
+    return {}
+
+def _emitir(data: dict) -> dict:
+    """Genera el número, guarda polizas/{numero}.json y retorna la respuesta de la póliza."""
+    for _ in range(MAX_INTENTOS_NUMERO):
+        # Número de 10 cifras tomado del contador (últimos 10 dígitos)
+        numero_poliza = f"{next(_contador_polizas):010d}"[-10:]
+
+        # Construir payload a guardar
+        payload = {
+            **{k: data[k] for k in REQUIRED_FIELDS},
+            "numero_poliza": numero_poliza,
+            "fecha_emision": datetime.utcnow().isoformat() + "Z"
+        }
+
+        # JSON compacto (solo lo leen programas); indentado únicamente en modo debug
+        contenido = _dump_poliza(payload)
+        outfile = POLIZAS_DIR / f"{numero_poliza}.json"
+        tmpfile = POLIZAS_DIR / f"{numero_poliza}.{os.getpid()}.tmp"
+        tmpfile.write_bytes(_dump_poliza_legible(payload) if app.debug else contenido)
+        try:
+            # os.link falla si el destino existe: reserva el número sin sobrescribir y
+            # publica el archivo completo de una vez (un lector nunca lo ve a medias)
+            os.link(tmpfile, outfile)
+        except FileExistsError:
+            # Número ya usado (otro proceso o vuelta del contador): probar el siguiente
+            continue
+        finally:
+            tmpfile.unlink(missing_ok=True)
 
-    # Generar número aleatorio de 10 cifras (con ceros a la izquierda si aplica)
-    numero_poliza = str(random.randint(0, 9_999_999_999)).zfill(10)
+        _registrar(numero_poliza, contenido)
+        return {
+            "numero_poliza": numero_poliza,
+            "archivo": str(outfile.relative_to(Path(__file__).parent)),
+            "mensaje": "Póliza emitida y guardada correctamente."
+        }
 
-    # Construir payload a guardar
-    payload = {
-        **{k: data[k] for k in REQUIRED_FIELDS},
-        "numero_poliza": numero_poliza,
-        "fecha_emision": datetime.utcnow().isoformat() + "Z"
-    }
+    raise FileExistsError(f"Sin número de póliza libre tras {MAX_INTENTOS_NUMERO} intentos")
+
+def _registrar(numero_poliza: str, registro: bytes) -> None:
+    """Agrega la póliza (JSON compacto) a polizas.jsonl y su ubicación a polizas.idx."""
+    with _registro_lock:
+        with open(POLIZAS_JSONL, "ab") as f:
+            offset = f.seek(0, os.SEEK_END)
+            f.write(registro + b"\n")
+        # El índice se escribe después del dato: un lector nunca ve un offset sin registro
+        with open(POLIZAS_IDX, "ab") as f:
+            f.write(f"{numero_poliza},{offset},{len(registro)}\n".encode("ascii"))
+
+@app.route("/expedir-poliza", methods=["POST"])
+def expedir_poliza():
+    if not request.is_json:
+        return jsonify({"error": "El cuerpo debe ser JSON"}), 400
+
+    data = request.get_json(silent=True) or {}
+
+    errores = _validar(data)
+    if errores:
+        return jsonify(errores), 400
 
-    # Guardar archivo en polizas/{numero}.json
-    outfile = POLIZAS_DIR / f"{numero_poliza}.json"
     try:
-        with outfile.open("w", encoding="utf-8") as f:
-            json.dump(payload, f, ensure_ascii=False, indent=2)
+        resultado = _emitir(data)
     except Exception as e:
         return jsonify({
             "error": "No se pudo guardar la póliza en disco",
             "detalle": str(e)
         }), 500
 
+    return jsonify(resultado), 201
+
+@app.route("/expedir-poliza/batch", methods=["POST"])
+def expedir_polizas_batch():
+    """Emite varias pólizas en una sola petición: {"policies": [...]}."""
+    if not request.is_json:
+        return jsonify({"error": "El cuerpo debe ser JSON"}), 400
+
+    policies = (request.get_json(silent=True) or {}).get("policies")
+    if not isinstance(policies, list) or not policies:
+        return jsonify({"error": "Se esperaba una lista no vacía en 'policies'"}), 400
+
+    # Validar todas antes de emitir ninguna
+    errores = []
+    for indice, data in enumerate(policies):
+        detalle = _validar(data)
+        if detalle:
+            errores.append({"indice": indice, **detalle})
+    if errores:
+        return jsonify({"error": "Datos inválidos", "detalles": errores}), 400
+
+    emitidas = []
+    try:
+        for data in policies:
+            emitidas.append(_emitir(data))
+    except Exception as e:
+        return jsonify({
+            "error": "No se pudo guardar la póliza en disco",
+            "detalle": str(e),
+            "emitidas": emitidas
+        }), 500
+
     return jsonify({
-        "numero_poliza": numero_poliza,
-        "archivo": str(outfile.relative_to(Path(__file__).parent)),
-        "mensaje": "Póliza emitida y guardada correctamente."
+        "polizas": emitidas,
+        "mensaje": f"{len(emitidas)} pólizas emitidas y guardadas correctamente."
     }), 201
 
 
 if __name__ == "__main__":
-    app.run(host="localhost", port=8000, debug=True)
+    host = os.getenv("EXPEDITION_API_HOST", "localhost")
+    port = int(os.getenv("EXPEDITION_API_PORT", "8000"))
+
+    if os.getenv("FLASK_DEBUG", "").lower() in ("1", "true"):
+        # Solo desarrollo: servidor de Werkzeug con reloader y debugger
+        app.run(host=host, port=port, debug=True)
+    else:
+        try:
+            # Servidor WSGI de producción (multihilo, también funciona en Windows)
+            from waitress import serve
+        except ImportError:
+            app.run(host=host, port=port, threaded=True)
+        else:
+            serve(app, host=host, port=port, threads=int(os.getenv("EXPEDITION_API_THREADS", "8")))
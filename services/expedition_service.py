@@ -3,22 +3,118 @@ Servicio de expedición de pólizas integrado.
 Cliente para la API de expedición existente con validaciones y logging.
 """
 
-import requests
+import atexit
 import json
-from typing import Dict, Optional
+import re
+import socket
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
 from datetime import datetime
+from urllib.parse import urlsplit
 
 from utils.config import config
 from utils.logging_config import get_logger
 
+try:
+    from orjson import loads as _loads_json  # Parser JSON en C (opcional)
+except ImportError:
+    _loads_json = json.loads
+
 logger = get_logger("expedition_service")
 
+# Pólizas guardadas por la API de expedición (archivo por póliza + registro agregado)
+POLIZAS_DIR = Path(__file__).parent / "expedition_api" / "polizas"
+POLIZAS_JSONL = POLIZAS_DIR / "polizas.jsonl"
+POLIZAS_IDX = POLIZAS_DIR / "polizas.idx"
+
+# Resultado de health_check reutilizado durante este tiempo (segundos)
+HEALTH_CHECK_TTL = 2.0
+
+# Validaciones de datos del tomador
+_CEDULA_RE = re.compile(r"[0-9]{6,12}")
+_CELULAR_RE = re.compile(r"[0-9]{10}")
+_EMAIL_RE = re.compile(r"[^@\s]+@[^@\s]+\.[^@\s]+")
+
 class ExpeditionService:
     """Servicio para expedición de pólizas usando la API Flask existente"""
     
     def __init__(self, api_base_url: Optional[str] = None):
         self.api_base_url = api_base_url or "http://localhost:8000"
         self.logger = get_logger("expedition_service")
+        self._session = None
+        self._session_lock = threading.Lock()
+        # Índice en memoria de polizas.idx: numero_poliza -> (offset, tamaño) en polizas.jsonl
+        self._policy_index: Dict[str, Tuple[int, int]] = {}
+        self._policy_index_pos = 0
+        self._policy_index_lock = threading.Lock()
+        self._health_cache: Optional[Tuple[float, bool]] = None
+    
+    def _get_session(self):
+        """
+        Sesión HTTP persistente (keep-alive y pool de conexiones), creada en el primer uso
+        
+        Import diferido: requests (urllib3, ssl) solo se carga si se llega a llamar la API.
+        Los reintentos usan los métodos por defecto de urllib3, así que un POST de
+        expedición nunca se reenvía (solo se reintentan fallos de conexión).
+        """
+        if self._session is None:
+            with self._session_lock:
+                if self._session is None:
+                    import requests
+                    from requests.adapters import HTTPAdapter
+                    from urllib3.util.retry import Retry
+                    
+                    session = requests.Session()
+                    adapter = HTTPAdapter(
+                        pool_connections=4,
+                        pool_maxsize=16,
+                        max_retries=Retry(total=2, backoff_factor=0.1, status_forcelist=[502, 503, 504])
+                    )
+                    session.mount("http://", adapter)
+                    session.mount("https://", adapter)
+                    atexit.register(self.close)
+                    self._session = session
+        return self._session
+    
+    def close(self):
+        """Cierra la sesión HTTP y sus conexiones"""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+    
+    def _refresh_policy_index(self):
+        """Lee solo las líneas nuevas de polizas.idx (el índice es de solo adición)"""
+        try:
+            with open(POLIZAS_IDX, "rb") as f:
+                f.seek(self._policy_index_pos)
+                chunk = f.read()
+        except FileNotFoundError:
+            return
+        
+        # Ignorar una última línea incompleta; se leerá en la siguiente actualización
+        end = chunk.rfind(b"\n") + 1
+        for line in chunk[:end].splitlines():
+            numero, offset, size = line.decode("ascii").split(",")
+            self._policy_index[numero] = (int(offset), int(size))
+        self._policy_index_pos += end
+    
+    def _read_policy_record(self, numero_poliza: str) -> Optional[bytes]:
+        """Retorna los bytes JSON de la póliza desde polizas.jsonl, o None si no está indexada"""
+        with self._policy_index_lock:
+            location = self._policy_index.get(numero_poliza)
+            if location is None:
+                self._refresh_policy_index()
+                location = self._policy_index.get(numero_poliza)
+        
+        if location is None:
+            return None
+        
+        offset, size = location
+        with open(POLIZAS_JSONL, "rb") as f:
+            f.seek(offset)
+            return f.read(size)
     
     def validate_client_data(self, client_data: Dict) -> Dict[str, str]:
         """
@@ -46,17 +142,17 @@ class ExpeditionService:
         # Validaciones específicas
         if "identificacion_tomador" in client_data:
             cedula = str(client_data["identificacion_tomador"]).strip()
-            if not cedula.isdigit() or len(cedula) < 6 or len(cedula) > 12:
+            if not _CEDULA_RE.fullmatch(cedula):
                 errors["identificacion_tomador"] = "Cédula debe tener entre 6 y 12 dígitos"
         
         if "celular_tomador" in client_data:
             celular = str(client_data["celular_tomador"]).strip()
-            if not celular.isdigit() or len(celular) != 10:
+            if not _CELULAR_RE.fullmatch(celular):
                 errors["celular_tomador"] = "Celular debe tener exactamente 10 dígitos"
         
         if "email_tomador" in client_data:
             email = client_data["email_tomador"].strip()
-            if "@" not in email or "." not in email:
+            if not _EMAIL_RE.fullmatch(email):
                 errors["email_tomador"] = "Email debe tener formato válido"
         
         return errors
@@ -120,6 +216,9 @@ class ExpeditionService:
         Returns:
             Dict con resultado de la expedición
         """
+        # Import diferido (para requests.RequestException); ya cargado por _get_session
+        import requests
+        
         self.logger.info(
             "Iniciando expedición de póliza",
             cedula=expedition_payload.get("identificacion_tomador"),
@@ -128,7 +227,7 @@ class ExpeditionService:
         
         try:
             # Llamada a la API de expedición
-            response = requests.post(
+            response = self._get_session().post(
                 f"{self.api_base_url}/expedir-poliza",
                 json=expedition_payload,
                 headers={"Content-Type": "application/json"},
@@ -185,6 +284,82 @@ class ExpeditionService:
                 "details": str(e)
             }
     
+    def expedite_policies(self, expedition_payloads: List[Dict]) -> Dict:
+        """
+        Expide varias pólizas en una sola petición al endpoint batch
+        
+        La API valida todas antes de emitir: si alguna es inválida no se emite ninguna.
+        
+        Args:
+            expedition_payloads: Lista de payloads formateados para expedición
+            
+        Returns:
+            Dict con resultado de la expedición y las pólizas emitidas
+        """
+        # Import diferido (para requests.RequestException); ya cargado por _get_session
+        import requests
+        
+        self.logger.info("Iniciando expedición en lote", cantidad=len(expedition_payloads))
+        
+        try:
+            response = self._get_session().post(
+                f"{self.api_base_url}/expedir-poliza/batch",
+                json={"policies": expedition_payloads},
+                headers={"Content-Type": "application/json"},
+                timeout=30
+            )
+            
+            if response.status_code == 201:
+                result = response.json()
+                fecha_expedicion = datetime.now().isoformat()
+                
+                self.logger.info("Pólizas expedidas exitosamente", cantidad=len(result["polizas"]))
+                
+                return {
+                    "success": True,
+                    "polizas": [
+                        {
+                            "numero_poliza": poliza["numero_poliza"],
+                            "mensaje": poliza["mensaje"],
+                            "archivo_poliza": poliza.get("archivo"),
+                            "fecha_expedicion": fecha_expedicion
+                        }
+                        for poliza in result["polizas"]
+                    ],
+                    "mensaje": result["mensaje"]
+                }
+            
+            error_data = response.json() if response.content else {}
+            error_msg = error_data.get("error", f"Error HTTP {response.status_code}")
+            
+            self.logger.error(
+                "Error en expedición en lote",
+                status_code=response.status_code,
+                error=error_msg
+            )
+            
+            return {
+                "success": False,
+                "error": error_msg,
+                "details": error_data
+            }
+        
+        except requests.RequestException as e:
+            self.logger.error(f"Error de conexión con API de expedición: {str(e)}")
+            return {
+                "success": False,
+                "error": "Error de conexión con el sistema de expedición",
+                "details": str(e)
+            }
+        
+        except Exception as e:
+            self.logger.error(f"Error inesperado en expedición en lote: {str(e)}")
+            return {
+                "success": False,
+                "error": "Error interno durante la expedición",
+                "details": str(e)
+            }
+    
     def get_policy_status(self, numero_poliza: str) -> Dict:
         """
         Consulta el estado de una póliza (funcionalidad extendida)
@@ -196,13 +371,16 @@ class ExpeditionService:
             Dict con información de la póliza
         """
         try:
-            # En la implementación actual, verificar si existe el archivo
-            import os
-            policy_file = f"services/expedition_api/polizas/{numero_poliza}.json"
+            # Registro agregado (un seek + lectura exacta); pólizas anteriores al índice
+            # se buscan en su archivo individual
+            record = self._read_policy_record(numero_poliza)
+            if record is None:
+                policy_file = POLIZAS_DIR / f"{numero_poliza}.json"
+                if policy_file.exists():
+                    record = policy_file.read_bytes()
             
-            if os.path.exists(policy_file):
-                with open(policy_file, 'r', encoding='utf-8') as f:
-                    policy_data = json.load(f)
+            if record is not None:
+                policy_data = _loads_json(record)
                 
                 return {
                     "exists": True,
@@ -225,21 +403,26 @@ class ExpeditionService:
     
     def health_check(self) -> bool:
         """
-        Verifica si la API de expedición está disponible
+        Verifica si la API de expedición está disponible (conexión TCP, cacheada HEALTH_CHECK_TTL)
         
         Returns:
-            True si la API responde, False en caso contrario
+            True si la API acepta conexiones, False en caso contrario
         """
+        now = time.monotonic()
+        if self._health_cache and now - self._health_cache[0] < HEALTH_CHECK_TTL:
+            return self._health_cache[1]
+        
+        # Basta con que el puerto acepte conexiones: sin HTTP ni import de requests
+        url = urlsplit(self.api_base_url)
+        port = url.port or (443 if url.scheme == "https" else 80)
         try:
-            # Intentar hacer una petición simple (podría ser un endpoint de health)
-            response = requests.get(
-                f"{self.api_base_url}/",
-                timeout=5
-            )
-            return response.status_code < 500
-            
-        except Exception:
-            return False
+            with socket.create_connection((url.hostname or "localhost", port), timeout=1.0):
+                healthy = True
+        except OSError:
+            healthy = False
+        
+        self._health_cache = (now, healthy)
+        return healthy
 
 # Instancia global del servicio
 expedition_service = ExpeditionService()
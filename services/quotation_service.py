@@ -3,15 +3,19 @@ Servicio de cotización integrado para el sistema de agentes.
 Integra la función de cotización existente con capacidades de visión y validación.
 """
 
+import asyncio
 import os
 import sys
+from types import MappingProxyType
 import pandas as pd
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, FrozenSet, List, Mapping, Optional, Tuple
 from pathlib import Path
 import base64
 from PIL import Image
 import io
 import json
+import time
+from functools import lru_cache
 import openai
 
 # Agregar el path del servicio original para importar
@@ -21,8 +25,91 @@ from cotizacion import configurar_fuente_excel, cotizar_poliza, PLAN_RATES
 from utils.config import config
 from utils.logging_config import get_logger
 
+try:
+    from orjson import loads as _loads_json  # Parser JSON en C (opcional)
+except ImportError:
+    _loads_json = json.loads
+
 logger = get_logger("quotation_service")
 
+# Prompt específico para reconocimiento de vehículos
+VEHICLE_VISION_PROMPT = """
+            Analiza esta imagen de vehículo y extrae las siguientes características:
+            
+            1. MARCA del vehículo (ejemplos: Toyota, Chevrolet, Ford, Nissan, etc.)
+            2. CLASE del vehículo (usar EXACTAMENTE uno de estos valores):
+               - AUTOMOVIL
+               - CAMIONETA PASAJ.
+               - PICKUP DOBLE CAB
+               - MOTOCICLETA
+               - CAMPERO
+               - REMOLCADOR
+            
+            3. COLOR principal del vehículo (ejemplos: Rojo, Azul, Blanco, Negro, Gris, Plateado, Amarillo, Beige)
+            
+            Responde ÚNICAMENTE en el siguiente formato JSON, sin texto adicional:
+            {
+                "marca": "MARCA_DETECTADA",
+                "clase": "CLASE_EXACTA",
+                "color": "COLOR_DETECTADO"
+            }
+            
+            IMPORTANTE: 
+            - La clase debe ser EXACTAMENTE una de las opciones listadas
+            - Si no puedes determinar algún valor, usa "NO_DETECTADO"
+            - Sé preciso en la identificación de la marca
+            """
+
+# Salida estructurada: el modelo responde solo JSON con estas claves (sin texto ni ```json)
+VEHICLE_CLASSES = [
+    "AUTOMOVIL",
+    "CAMIONETA PASAJ.",
+    "PICKUP DOBLE CAB",
+    "MOTOCICLETA",
+    "CAMPERO",
+    "REMOLCADOR",
+    "NO_DETECTADO",
+]
+VEHICLE_VISION_SCHEMA = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "vehicle",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                "marca": {"type": "string"},
+                "clase": {"type": "string", "enum": VEHICLE_CLASSES},
+                "color": {"type": "string"}
+            },
+            "required": ["marca", "clase", "color"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Máximo de análisis de imagen simultáneos en un lote (límite de tasa de Azure)
+VISION_BATCH_CONCURRENCY = 10
+
+# Batch API de Azure OpenAI (análisis masivo no interactivo)
+BATCH_TERMINAL_STATES = frozenset({"completed", "failed", "expired", "cancelled"})
+BATCH_POLL_INITIAL_SECONDS = 5.0
+BATCH_POLL_MAX_SECONDS = 300.0
+
+@lru_cache(maxsize=64)
+def _filtered_rates(planes: Optional[FrozenSet[str]]) -> Mapping[str, float]:
+    """Tasas de los planes pedidos (todas si planes es None); solo lectura, compartidas entre cotizaciones"""
+    if planes is None:
+        return PLAN_RATES
+    return MappingProxyType({plan: rate for plan, rate in PLAN_RATES.items() if plan in planes})
+
+@lru_cache(maxsize=8)
+def _catalog_sample(excel_path: str, mtime: float, limit: int) -> Tuple[Dict, ...]:
+    """Primeras filas del Excel; la clave incluye mtime, así un archivo editado se relee"""
+    # nrows: openpyxl deja de leer filas al completar la muestra
+    df = pd.read_excel(excel_path, nrows=limit)
+    return tuple(df.to_dict('records'))
+
 class VehicleRecognitionService:
     """Servicio de reconocimiento de vehículos usando GPT-4 Vision"""
     
@@ -35,6 +122,18 @@ class VehicleRecognitionService:
             api_version=config.azure_openai.api_version,
             azure_endpoint=config.azure_openai.endpoint
         )
+        # Cliente asíncrono para análisis en paralelo. Sus conexiones quedan ligadas al
+        # primer event loop que lo usa: solo para llamadas desde un loop persistente
+        self.async_client = self._new_async_client()
+    
+    @staticmethod
+    def _new_async_client() -> "openai.AsyncAzureOpenAI":
+        """Crea un cliente asíncrono de Azure OpenAI"""
+        return openai.AsyncAzureOpenAI(
+            api_key=config.azure_openai.api_key,
+            api_version=config.azure_openai.api_version,
+            azure_endpoint=config.azure_openai.endpoint
+        )
     
     def analyze_vehicle_image(self, image_data: bytes) -> Dict[str, str]:
         """
@@ -50,123 +149,128 @@ class VehicleRecognitionService:
             # Convertir imagen a base64 para OpenAI
             image_b64 = base64.b64encode(image_data).decode('utf-8')
             
-            # Prompt específico para reconocimiento de vehículos
-            prompt = """
-            Analiza esta imagen de vehículo y extrae las siguientes características:
-            
-            1. MARCA del vehículo (ejemplos: Toyota, Chevrolet, Ford, Nissan, etc.)
-            2. CLASE del vehículo (usar EXACTAMENTE uno de estos valores):
-               - AUTOMOVIL
-               - CAMIONETA PASAJ.
-               - PICKUP DOBLE CAB
-               - MOTOCICLETA
-               - CAMPERO
-               - REMOLCADOR
-            
-            3. COLOR principal del vehículo (ejemplos: Rojo, Azul, Blanco, Negro, Gris, Plateado, Amarillo, Beige)
-            
-            Responde ÚNICAMENTE en el siguiente formato JSON, sin texto adicional:
-            {
-                "marca": "MARCA_DETECTADA",
-                "clase": "CLASE_EXACTA",
-                "color": "COLOR_DETECTADO"
-            }
-            
-            IMPORTANTE: 
-            - La clase debe ser EXACTAMENTE una de las opciones listadas
-            - Si no puedes determinar algún valor, usa "NO_DETECTADO"
-            - Sé preciso en la identificación de la marca
-            """
-            
             # Llamar a Azure OpenAI GPT-4o Vision para análisis real
-            return self._call_azure_vision_api(image_b64, prompt)
+            return self._call_azure_vision_api(image_b64, VEHICLE_VISION_PROMPT)
             
         except Exception as e:
             self.logger.error(f"Error en análisis de imagen: {str(e)}")
-            return {
-                "marca": "NO_DETECTADO",
-                "clase": "NO_DETECTADO", 
-                "color": "NO_DETECTADO"
-            }
+            return self._not_detected()
+    
+    async def analyze_vehicle_image_async(self, image_data: bytes,
+                                          client: Optional["openai.AsyncAzureOpenAI"] = None) -> Dict[str, str]:
+        """
+        Versión asíncrona de analyze_vehicle_image (mismo resultado y mismos fallbacks)
+        
+        Args:
+            image_data: Datos binarios de la imagen
+            client: Cliente asíncrono a usar (por defecto self.async_client)
+            
+        Returns:
+            Dict con marca, clase y color detectados
+        """
+        try:
+            image_b64 = base64.b64encode(image_data).decode('utf-8')
+            request = self._vision_request(image_b64, VEHICLE_VISION_PROMPT)
+        except Exception as e:
+            self.logger.error(f"Error en análisis de imagen: {str(e)}")
+            return self._not_detected()
+        
+        try:
+            response = await (client or self.async_client).chat.completions.create(**request)
+            return self._parse_vision_content(response.choices[0].message.content)
+        except Exception as e:
+            self.logger.error(f"Error llamando Azure Vision API: {str(e)}")
+            return self._simulate_vision_response(None)
+    
+    async def analyze_vehicle_images_batch(self, images: List[bytes],
+                                           max_concurrency: int = VISION_BATCH_CONCURRENCY,
+                                           client: Optional["openai.AsyncAzureOpenAI"] = None) -> List[Dict[str, str]]:
+        """
+        Analiza varias imágenes en paralelo, con a lo sumo max_concurrency llamadas en vuelo
+        
+        Args:
+            images: Lista de imágenes (datos binarios)
+            max_concurrency: Límite de llamadas simultáneas a Azure
+            client: Cliente asíncrono a usar (por defecto self.async_client)
+            
+        Returns:
+            Lista de resultados en el mismo orden que images
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+        
+        async def _one(image_data: bytes) -> Dict[str, str]:
+            async with semaphore:
+                return await self.analyze_vehicle_image_async(image_data, client)
+        
+        return await asyncio.gather(*(_one(image_data) for image_data in images))
+    
+    def analyze_vehicle_images(self, images: List[bytes]) -> List[Dict[str, str]]:
+        """
+        Envoltorio síncrono de analyze_vehicle_images_batch
+        
+        No usar desde un event loop en ejecución (ahí se debe esperar la corrutina).
+        Cada llamada crea su propio loop, así que usa un cliente propio que se cierra
+        con él: las conexiones de self.async_client no sirven en un loop distinto.
+        """
+        async def _run() -> List[Dict[str, str]]:
+            async with self._new_async_client() as client:
+                return await self.analyze_vehicle_images_batch(images, client=client)
+        
+        return asyncio.run(_run())
+    
+    @staticmethod
+    def _not_detected() -> Dict[str, str]:
+        """Resultado cuando la imagen no se pudo procesar"""
+        return {
+            "marca": "NO_DETECTADO",
+            "clase": "NO_DETECTADO", 
+            "color": "NO_DETECTADO"
+        }
+    
+    @staticmethod
+    def _vision_request(image_b64: str, prompt: str) -> Dict:
+        """Argumentos de chat.completions.create para analizar una imagen"""
+        return {
+            "model": config.azure_openai.chat_deployment,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": prompt},
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": f"data:image/jpeg;base64,{image_b64}"
+                            }
+                        }
+                    ]
+                }
+            ],
+            "response_format": VEHICLE_VISION_SCHEMA,
+            "max_tokens": 500,
+            "temperature": 0.1
+        }
     
     def _call_azure_vision_api(self, image_b64: str, prompt: str) -> Dict[str, str]:
         """
         Llama a Azure OpenAI GPT-4o Vision para análisis real de imagen
         """
         try:
-            response = self.azure_client.chat.completions.create(
-                model=config.azure_openai.chat_deployment,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {"type": "text", "text": prompt},
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": f"data:image/jpeg;base64,{image_b64}"
-                                }
-                            }
-                        ]
-                    }
-                ],
-                max_tokens=500,
-                temperature=0.1
-            )
-            
-            # Parsear respuesta JSON
-            content = response.choices[0].message.content.strip()
-            self.logger.info(f"Respuesta de Azure Vision: {content}")
-            
-            # Intentar parsear como JSON
-            try:
-                # Limpiar la respuesta para extraer solo el JSON
-                if "```json" in content:
-                    # Extraer contenido entre ```json y ```
-                    json_start = content.find("```json") + 7
-                    json_end = content.find("```", json_start)
-                    json_content = content[json_start:json_end].strip()
-                else:
-                    json_content = content.strip()
-                
-                # Si empieza con ```json, extraer solo el JSON
-                if json_content.startswith("```json"):
-                    json_content = json_content[7:]
-                if json_content.endswith("```"):
-                    json_content = json_content[:-3]
-                    
-                json_content = json_content.strip()
-                
-                result = json.loads(json_content)
-                self.logger.info(f"JSON parseado exitosamente: {result}")
-                return result
-                
-            except (json.JSONDecodeError, IndexError, ValueError) as e:
-                # Si no es JSON válido, extraer usando regex como último recurso
-                self.logger.warning(f"Respuesta no es JSON válido ({str(e)}), intentando extracción regex")
-                
-                import re
-                marca_match = re.search(r'"marca":\s*"([^"]+)"', content)
-                clase_match = re.search(r'"clase":\s*"([^"]+)"', content)
-                color_match = re.search(r'"color":\s*"([^"]+)"', content)
-                
-                if marca_match and clase_match and color_match:
-                    result = {
-                        "marca": marca_match.group(1),
-                        "clase": clase_match.group(1),
-                        "color": color_match.group(1)
-                    }
-                    self.logger.info(f"Extraído con regex: {result}")
-                    return result
-                else:
-                    self.logger.warning("No se pudo extraer datos con regex, usando fallback")
-                    return self._simulate_vision_response(None)
+            response = self.azure_client.chat.completions.create(**self._vision_request(image_b64, prompt))
+            return self._parse_vision_content(response.choices[0].message.content)
                 
         except Exception as e:
             self.logger.error(f"Error llamando Azure Vision API: {str(e)}")
             # Fallback a simulación si falla la API
             return self._simulate_vision_response(None)
     
+    def _parse_vision_content(self, content: str) -> Dict[str, str]:
+        """
+        Parsea la respuesta del modelo (JSON garantizado por VEHICLE_VISION_SCHEMA)
+        """
+        self.logger.info(f"Respuesta de Azure Vision: {content}")
+        return _loads_json(content)
+    
     def _simulate_vision_response(self, image_data: bytes) -> Dict[str, str]:
         """
         Simula respuesta de GPT-4 Vision usando datos del CSV de ejemplo.
@@ -216,6 +320,7 @@ class QuotationService:
                 excel_path = config.get_absolute_path("data/vehicles/Listado de carros asegurables.xlsx")
             
             if excel_path.exists():
+                self.excel_path = excel_path
                 configurar_fuente_excel(str(excel_path))
                 self.logger.info(f"Servicio de cotización configurado con: {excel_path}")
             else:
@@ -306,10 +411,8 @@ class QuotationService:
         )
         
         try:
-            # Filtrar planes si se especificaron
-            plan_rates = PLAN_RATES.copy()
-            if planes:
-                plan_rates = {plan: rate for plan, rate in plan_rates.items() if plan in planes}
+            # Filtrar planes si se especificaron (cacheado por conjunto de planes)
+            plan_rates = _filtered_rates(frozenset(planes) if planes else None)
             
             # Generar cotización usando la función original
             quotation_result = cotizar_poliza(
@@ -347,6 +450,91 @@ class QuotationService:
             self.logger.error(f"Error generando cotización: {str(e)}")
             raise
     
+    def submit_vehicle_batch(self, images: List[bytes]) -> str:
+        """
+        Envía un lote de imágenes a la Batch API de Azure OpenAI (ventana de 24 h)
+        
+        Para cargas masivas sin urgencia: menor costo y sin presión sobre el límite
+        de peticiones por minuto. Requiere un deployment de tipo batch.
+        
+        Args:
+            images: Lista de imágenes (datos binarios)
+            
+        Returns:
+            ID del batch, para consultar con wait_for_batch
+        """
+        vision = self.vision_service
+        lines = []
+        for index, image_data in enumerate(images):
+            image_b64 = base64.b64encode(image_data).decode('utf-8')
+            lines.append(json.dumps({
+                "custom_id": str(index),
+                "method": "POST",
+                "url": "/chat/completions",
+                "body": vision._vision_request(image_b64, VEHICLE_VISION_PROMPT)
+            }))
+        
+        batch_file = vision.azure_client.files.create(
+            file=("vehicle_batch.jsonl", "\n".join(lines).encode("utf-8")),
+            purpose="batch"
+        )
+        batch = vision.azure_client.batches.create(
+            input_file_id=batch_file.id,
+            endpoint="/chat/completions",
+            completion_window="24h"
+        )
+        
+        self.logger.info("Batch de imágenes enviado", batch_id=batch.id, images_count=len(images))
+        return batch.id
+    
+    def wait_for_batch(self, batch_id: str, timeout: Optional[float] = None) -> List[Dict[str, str]]:
+        """
+        Espera un batch de submit_vehicle_batch y retorna sus resultados
+        
+        Args:
+            batch_id: ID retornado por submit_vehicle_batch
+            timeout: Segundos máximos de espera (None = sin límite)
+            
+        Returns:
+            Lista de resultados (marca, clase, color) en el orden de las imágenes enviadas;
+            las imágenes que fallaron quedan como NO_DETECTADO
+        """
+        client = self.vision_service.azure_client
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        delay = BATCH_POLL_INITIAL_SECONDS
+        
+        # Polling con backoff exponencial hasta un estado terminal
+        batch = client.batches.retrieve(batch_id)
+        while batch.status not in BATCH_TERMINAL_STATES:
+            if deadline is not None and time.monotonic() + delay > deadline:
+                raise TimeoutError(f"El batch {batch_id} sigue en estado '{batch.status}'")
+            time.sleep(delay)
+            delay = min(delay * 2, BATCH_POLL_MAX_SECONDS)
+            batch = client.batches.retrieve(batch_id)
+        
+        total = batch.request_counts.total if batch.request_counts else 0
+        results = [self.vision_service._not_detected() for _ in range(total)]
+        self.logger.info("Batch de imágenes finalizado", batch_id=batch_id, status=batch.status)
+        
+        if not batch.output_file_id:
+            return results
+        
+        for line in client.files.content(batch.output_file_id).text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            index = int(record["custom_id"])
+            response = record.get("response") or {}
+            if response.get("status_code") != 200 or index >= total:
+                continue
+            try:
+                content = response["body"]["choices"][0]["message"]["content"]
+                results[index] = self.vision_service._parse_vision_content(content)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                self.logger.warning(f"Respuesta inválida en batch {batch_id}, imagen {index}: {str(e)}")
+        
+        return results
+    
     def get_available_plans(self) -> List[str]:
         """Obtiene lista de planes disponibles"""
         return list(PLAN_RATES.keys())
@@ -362,16 +550,12 @@ class QuotationService:
             Lista de vehículos de ejemplo
         """
         try:
-            # Cargar Excel para obtener muestra
-            excel_path = config.get_absolute_path("services/cotizacion_original/data/carros.xlsx")
-            
-            if not excel_path.exists():
-                excel_path = config.get_absolute_path("data/vehicles/Listado de carros asegurables.xlsx")
+            # Muestra cacheada del mismo Excel configurado en _setup_quotation_service
+            excel_path = self.excel_path
             
             if excel_path.exists():
-                df = pd.read_excel(excel_path)
-                sample = df.head(limit).to_dict('records')
-                return sample
+                sample = _catalog_sample(str(excel_path), excel_path.stat().st_mtime, limit)
+                return [dict(row) for row in sample]
             else:
                 return []
                 
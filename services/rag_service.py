@@ -3,6 +3,7 @@ Servicio RAG (Retrieval-Augmented Generation) para consultas sobre seguros.
 Procesa documentos PDF y proporciona búsqueda semántica con respuestas contextualizadas.
 """
 
+import asyncio
 import os
 import uuid
 from pathlib import Path
@@ -354,66 +355,97 @@ class RAGService:
         
         try:
             # Buscar documentos relevantes
-            relevant_docs = self.vector_store.search_similar(question)
-            
-            if not relevant_docs:
-                return {
-                    "answer": "No encontré información específica sobre tu consulta en los documentos de Seguros Sura. ¿Podrías reformular tu pregunta o ser más específico?",
-                    "sources": [],
-                    "confidence": 0.0
-                }
-            
-            # Filtrar por threshold de similaridad
-            filtered_docs = [
-                (doc, score) for doc, score in relevant_docs 
-                if score >= config.rag.similarity_threshold
-            ]
-            
-            if not filtered_docs:
-                return {
-                    "answer": "La información disponible no parece ser muy relevante para tu consulta. Te recomiendo contactar a un asesor para una respuesta más precisa.",
-                    "sources": [],
-                    "confidence": 0.0
-                }
-            
-            # Preparar contexto para el LLM
-            context = self._prepare_context(filtered_docs)
-            
-            # Generar respuesta
-            answer = self._generate_answer(question, context)
-            
-            # Preparar fuentes
-            sources = []
-            if include_sources:
-                sources = self._extract_sources(filtered_docs)
-            
-            # Calcular confianza promedio
-            confidence = sum(score for _, score in filtered_docs) / len(filtered_docs)
-            
-            result = {
-                "answer": answer,
-                "sources": sources,
-                "confidence": confidence,
-                "docs_used": len(filtered_docs)
-            }
+            early_result, filtered_docs = self._filter_relevant_docs(self.vector_store.search_similar(question))
+            if early_result:
+                return early_result
             
-            self.logger.info(
-                "Consulta procesada",
-                docs_used=len(filtered_docs),
-                confidence=confidence,
-                answer_length=len(answer)
-            )
+            # Generar respuesta con el contexto de los documentos
+            answer = self._generate_answer(question, self._prepare_context(filtered_docs))
+            return self._build_query_result(answer, filtered_docs, include_sources)
+            
+        except Exception as e:
+            return self._query_error_result(e)
+    
+    async def aquery(self, question: str, include_sources: bool = True) -> Dict:
+        """
+        Versión asíncrona de query para los nodos del grafo
+        
+        La búsqueda (embeddings + Chroma, síncronos) corre en un hilo y la respuesta
+        usa ainvoke, así el event loop compartido sigue atendiendo otras sesiones y
+        astream_events recibe los tokens del modelo.
+        """
+        self.logger.info(f"Procesando consulta: {question[:100]}...")
+        
+        try:
+            relevant_docs = await asyncio.to_thread(self.vector_store.search_similar, question)
+            early_result, filtered_docs = self._filter_relevant_docs(relevant_docs)
+            if early_result:
+                return early_result
             
-            return result
+            answer = await self._agenerate_answer(question, self._prepare_context(filtered_docs))
+            return self._build_query_result(answer, filtered_docs, include_sources)
             
         except Exception as e:
-            self.logger.error(f"Error procesando consulta: {str(e)}")
+            return self._query_error_result(e)
+    
+    def _filter_relevant_docs(self, relevant_docs: List[Tuple[Document, float]]) -> Tuple[Optional[Dict], List[Tuple[Document, float]]]:
+        """Filtra por threshold de similaridad; si no queda nada devuelve la respuesta a dar"""
+        if not relevant_docs:
             return {
-                "answer": "Lo siento, ocurrió un error procesando tu consulta. Por favor intenta nuevamente o contacta a un asesor.",
+                "answer": "No encontré información específica sobre tu consulta en los documentos de Seguros Sura. ¿Podrías reformular tu pregunta o ser más específico?",
                 "sources": [],
-                "confidence": 0.0,
-                "error": str(e)
-            }
+                "confidence": 0.0
+            }, []
+        
+        filtered_docs = [
+            (doc, score) for doc, score in relevant_docs 
+            if score >= config.rag.similarity_threshold
+        ]
+        
+        if not filtered_docs:
+            return {
+                "answer": "La información disponible no parece ser muy relevante para tu consulta. Te recomiendo contactar a un asesor para una respuesta más precisa.",
+                "sources": [],
+                "confidence": 0.0
+            }, []
+        
+        return None, filtered_docs
+    
+    def _build_query_result(self, answer: str, filtered_docs: List[Tuple[Document, float]], include_sources: bool) -> Dict:
+        """Arma el resultado de la consulta con fuentes y confianza promedio"""
+        # Preparar fuentes
+        sources = []
+        if include_sources:
+            sources = self._extract_sources(filtered_docs)
+        
+        # Calcular confianza promedio
+        confidence = sum(score for _, score in filtered_docs) / len(filtered_docs)
+        
+        result = {
+            "answer": answer,
+            "sources": sources,
+            "confidence": confidence,
+            "docs_used": len(filtered_docs)
+        }
+        
+        self.logger.info(
+            "Consulta procesada",
+            docs_used=len(filtered_docs),
+            confidence=confidence,
+            answer_length=len(answer)
+        )
+        
+        return result
+    
+    def _query_error_result(self, error: Exception) -> Dict:
+        """Respuesta estándar cuando falla la consulta"""
+        self.logger.error(f"Error procesando consulta: {str(error)}")
+        return {
+            "answer": "Lo siento, ocurrió un error procesando tu consulta. Por favor intenta nuevamente o contacta a un asesor.",
+            "sources": [],
+            "confidence": 0.0,
+            "error": str(error)
+        }
     
     def _prepare_context(self, docs_with_scores: List[Tuple[Document, float]]) -> str:
         """Prepara contexto para el LLM desde documentos relevantes"""
@@ -425,10 +457,9 @@ class RAGService:
         
         return "\n\n---\n\n".join(context_parts)
     
-    def _generate_answer(self, question: str, context: str) -> str:
-        """Genera respuesta usando el LLM con contexto RAG"""
-        
-        prompt = f"""
+    def _build_answer_prompt(self, question: str, context: str) -> str:
+        """Prompt de respuesta con contexto RAG"""
+        return f"""
         Eres un asesor amigable y experto de Seguros Sura Colombia que ayuda a clientes con sus consultas sobre seguros de autos.
         
         Responde la siguiente pregunta basándote ÚNICAMENTE en la información proporcionada del contexto.
@@ -451,9 +482,21 @@ class RAGService:
         
         RESPUESTA:
         """
-        
+    
+    def _generate_answer(self, question: str, context: str) -> str:
+        """Genera respuesta usando el LLM con contexto RAG"""
+        try:
+            response = self.llm.invoke(self._build_answer_prompt(question, context))
+            return response.content.strip()
+            
+        except Exception as e:
+            self.logger.error(f"Error generando respuesta con LLM: {str(e)}")
+            return "Lo siento, no pude generar una respuesta en este momento. Por favor contacta a un asesor."
+    
+    async def _agenerate_answer(self, question: str, context: str) -> str:
+        """Como _generate_answer pero sin bloquear el event loop"""
         try:
-            response = self.llm.invoke(prompt)
+            response = await self.llm.ainvoke(self._build_answer_prompt(question, context))
             return response.content.strip()
             
         except Exception as e:
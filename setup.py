@@ -184,7 +184,7 @@ def install_problematic_packages():
     # Paquetes que pueden necesitar instalación especial
     problematic_packages = {
         "chromadb": "chromadb>=0.4.0",
-        "streamlit": "streamlit>=1.29.0",
+        "streamlit": "streamlit>=1.37.0",
         "langchain": "langchain>=0.1.0"
     }
     
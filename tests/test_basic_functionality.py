@@ -7,7 +7,9 @@ import pytest
 import asyncio
 import os
 import sys
+import time
 from pathlib import Path
+from types import SimpleNamespace
 
 # Agregar el directorio raíz al path
 project_root = Path(__file__).parent.parent
@@ -60,7 +62,96 @@ class TestBasicFunctionality:
             
         except Exception as e:
             pytest.fail(f"Error en base de datos: {e}")
-    
+
+    def test_quotation_persistence(self):
+        """Test que la cotización se recupera completa por quotation_id"""
+        session_id = db_manager.create_session("test", {"test": True})
+        quotation_result = {"quotations": {"Plan Basico": {"prima_anual": 1200000}}}
+
+        quotation_id = db_manager.save_quotation(session_id, {"marca": "TOYOTA"}, quotation_result)
+
+        assert db_manager.get_quotation(quotation_id) == quotation_result
+        assert db_manager.get_quotation("inexistente") is None
+
+    def test_agent_states_bulk_read(self):
+        """Test lectura de varios estados de agente en una sola consulta"""
+        session_id = db_manager.create_session("test", {"test": True})
+        db_manager.save_agent_state(session_id, "quotation", {"quotation_generated": True})
+
+        states = db_manager.get_agent_states(session_id, ["quotation", "expedition"])
+
+        assert states == {"quotation": {"quotation_generated": True}}
+
+    def test_message_and_status_single_transaction(self):
+        """Test que el mensaje del asesor y el cambio de estado se guardan juntos"""
+        session_id = db_manager.create_session("test", {"test": True})
+
+        db_manager.add_message_and_update_status(session_id, "completed", "human_advisor", "Caso cerrado")
+
+        assert db_manager.get_session(session_id).status == "completed"
+        assert db_manager.get_conversation_history(session_id)[-1].content == "Caso cerrado"
+
+    def test_advisor_messages_delta(self):
+        """Test sonda y consulta delta de mensajes del asesor"""
+        session_id = db_manager.create_session("test", {"test": True})
+        assert db_manager.get_last_advisor_ts(session_id) is None
+
+        db_manager.add_message(session_id, "human_advisor", "Hola")
+        last_seen = db_manager.get_last_advisor_ts(session_id)
+        db_manager.add_message(session_id, "user", "Gracias")
+        db_manager.add_message(session_id, "human_advisor", "¿Algo más?")
+
+        new_messages = db_manager.get_messages_since(session_id, last_seen, ["human_advisor"])
+
+        assert [msg.content for msg in new_messages] == ["¿Algo más?"]
+        assert db_manager.get_last_advisor_ts(session_id) == new_messages[-1].timestamp
+
+    def test_stream_user_input_on_client_loop(self):
+        """Test que el streaming del orquestador corre en el loop persistente del cliente"""
+        from interfaces.client_interface import _submit
+        session_id = db_manager.create_session("test", {"test": True})
+
+        async def collect():
+            return [event async for event in orchestrator.stream_user_input(
+                session_id=session_id, user_input="Hola", user_type="client"
+            )]
+
+        # Fuera del hilo del script no hay ScriptRunContext ni session_state
+        events = _submit(collect()).result(timeout=120)
+
+        assert events[-1]["type"] == "final"
+        assert all(event["type"] == "token" for event in events[:-1])
+
+    def test_concurrent_sessions_overlap(self, monkeypatch):
+        """Test que dos sesiones en el loop compartido no se serializan en la llamada al LLM"""
+        from interfaces.client_interface import _submit
+        from agents.intent_classifier import intent_classifier
+        intervals = []
+
+        async def fake_classify(user_input, context):
+            return {"intent": "consultation", "agent": "consultant", "confidence": 0.9}
+
+        async def fake_ainvoke(prompt):
+            start = time.monotonic()
+            await asyncio.sleep(0.5)
+            intervals.append((start, time.monotonic()))
+            return SimpleNamespace(content="¡Hola! ¿En qué puedo ayudarte?")
+
+        monkeypatch.setattr(intent_classifier, "classify_intent", fake_classify)
+        monkeypatch.setattr(rag_service, "llm", SimpleNamespace(ainvoke=fake_ainvoke))
+
+        session_ids = [db_manager.create_session("test", {"test": True}) for _ in range(2)]
+        futures = [
+            _submit(orchestrator.process_user_input(session_id=session_id, user_input="Hola", user_type="client"))
+            for session_id in session_ids
+        ]
+        for future in futures:
+            future.result(timeout=60)
+
+        assert len(intervals) == 2
+        (start_a, end_a), (start_b, end_b) = sorted(intervals)
+        assert start_b < end_a
+
     def test_rag_service_initialization(self):
         """Test inicialización del servicio RAG"""
         try:
@@ -195,6 +286,35 @@ class TestQuotationWithProvidedImages:
             except Exception as e:
                 pytest.fail(f"Error en análisis de vehículo: {e}")
 
+    def test_vehicle_images_batch_twice(self, monkeypatch):
+        """Test que el envoltorio síncrono del lote funciona en llamadas repetidas (un loop por llamada)"""
+        vision = quotation_service.vision_service
+        expected = {"marca": "MAZDA", "clase": "AUTOMOVIL", "color": "Rojo"}
+
+        class FakeAsyncClient:
+            """Cliente ligado al loop donde se abre, como las conexiones httpx reales"""
+            def __init__(self):
+                self.loop = None
+                self.chat = SimpleNamespace(completions=self)
+
+            async def __aenter__(self):
+                self.loop = asyncio.get_running_loop()
+                return self
+
+            async def __aexit__(self, *exc_info):
+                return False
+
+            async def create(self, **kwargs):
+                if asyncio.get_running_loop() is not self.loop or self.loop.is_closed():
+                    raise RuntimeError("Event loop is closed")
+                message = SimpleNamespace(content='{"marca": "MAZDA", "clase": "AUTOMOVIL", "color": "Rojo"}')
+                return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+
+        monkeypatch.setattr(vision, "_new_async_client", FakeAsyncClient)
+
+        for _ in range(2):
+            assert vision.analyze_vehicle_images([b"img1", b"img2"]) == [expected, expected]
+
 class TestExpeditionFlow:
     """Tests del flujo completo de expedición"""
     
@@ -5,6 +5,7 @@ Maneja persistencia de conversaciones, sesiones y estado del sistema.
 
 import sqlite3
 import json
+import threading
 import uuid
 from datetime import datetime
 from pathlib import Path
@@ -14,6 +15,14 @@ from contextlib import contextmanager
 
 from utils.config import config
 
+try:
+    import orjson  # Serializador JSON en C (opcional)
+    
+    def _dumps_metadata(metadata: Dict) -> str:
+        return orjson.dumps(metadata, option=orjson.OPT_NON_STR_KEYS).decode()
+except ImportError:
+    _dumps_metadata = json.dumps
+
 @dataclass
 class ConversationSession:
     """Modelo de sesión de conversación"""
@@ -39,6 +48,9 @@ class DatabaseManager:
     
     def __init__(self, db_path: Optional[str] = None):
         self.db_path = db_path or config.database.sqlite_path
+        self._local = threading.local()  # Una conexión por hilo
+        self._watch_conn = None  # Conexión de solo lectura para detectar cambios
+        self._watch_lock = threading.Lock()
         self._ensure_db_path()
         self._init_tables()
     
@@ -48,13 +60,36 @@ class DatabaseManager:
     
     @contextmanager
     def get_connection(self):
-        """Context manager para conexiones a la BD"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
+        """
+        Context manager para conexiones a la BD
+        
+        La conexión se reutiliza dentro de cada hilo para conservar su caché de
+        sentencias preparadas entre llamadas (INSERT de mensajes, polling, etc.).
+        """
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, cached_statements=256)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
         try:
             yield conn
         finally:
-            conn.close()
+            # Igual que al cerrar una conexión: lo que no se confirmó se descarta
+            if conn.in_transaction:
+                conn.rollback()
+    
+    def get_change_counter(self) -> int:
+        """
+        Contador de cambios de la BD (PRAGMA data_version)
+        
+        Se lee en una conexión dedicada que nunca escribe, así que cambia cada vez
+        que otra conexión, de este proceso o de otro (p. ej. la app cliente),
+        confirma una escritura. Consultarlo no toca ninguna tabla.
+        """
+        with self._watch_lock:
+            if self._watch_conn is None:
+                self._watch_conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            return self._watch_conn.execute("PRAGMA data_version").fetchone()[0]
     
     def _init_tables(self):
         """Inicializa las tablas de la base de datos"""
@@ -123,6 +158,18 @@ class DatabaseManager:
                 )
             """)
             
+            # Índice para el polling de mensajes por sesión y autor (incluye rowid implícito)
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_session_agent
+                ON messages (session_id, agent_type)
+            """)
+            
+            # Índice para las consultas delta por tipo de agente y timestamp
+            conn.execute("""
+                CREATE INDEX IF NOT EXISTS idx_messages_session_agent_ts
+                ON messages (session_id, agent_type, timestamp)
+            """)
+            
             conn.commit()
     
     def create_session(self, user_type: str, metadata: Optional[Dict] = None, session_id: Optional[str] = None) -> str:
@@ -186,30 +233,45 @@ class DatabaseManager:
                 }
             return None
     
-    def get_messages_after_timestamp(self, session_id: str, timestamp: str) -> List[Any]:
+    def get_messages_after_timestamp(self, session_id: str, timestamp: datetime) -> List[Message]:
         """Obtiene mensajes después de un timestamp específico para sincronización"""
+        return self.get_messages_since(session_id, timestamp)
+    
+    def get_messages_since(self, session_id: str, after_ts: Optional[datetime] = None,
+                           agent_types: Optional[List[str]] = None) -> List[Message]:
+        """
+        Obtiene solo los mensajes posteriores a after_ts (consulta delta para polling)
+        
+        Args:
+            session_id: ID de la sesión
+            after_ts: Último timestamp ya visto; None devuelve desde el inicio
+            agent_types: Filtra por tipo de agente (usa idx_messages_session_agent_ts)
+        """
+        query = "SELECT * FROM messages WHERE session_id = ?"
+        params: List[Any] = [session_id]
+        
+        if agent_types:
+            query += f" AND agent_type IN ({', '.join('?' for _ in agent_types)})"
+            params.extend(agent_types)
+        
+        if after_ts is not None:
+            # Se pasa como datetime para que se serialice igual que al insertar
+            query += " AND timestamp > ?"
+            params.append(after_ts)
+        
+        query += " ORDER BY timestamp ASC"
+        
         with self.get_connection() as conn:
-            cursor = conn.execute("""
-                SELECT id, session_id, agent_type, content, timestamp, metadata
-                FROM conversation_history 
-                WHERE session_id = ? AND timestamp > ?
-                ORDER BY timestamp ASC
-            """, (session_id, timestamp))
-            
-            rows = cursor.fetchall()
-            messages = []
-            for row in rows:
-                message = type('Message', (), {
-                    'id': row[0],
-                    'session_id': row[1],
-                    'agent_type': row[2],
-                    'content': row[3],
-                    'timestamp': datetime.fromisoformat(row[4]),
-                    'metadata': json.loads(row[5]) if row[5] else {}
-                })()
-                messages.append(message)
+            rows = conn.execute(query, params).fetchall()
             
-            return messages
+            return [Message(
+                message_id=row['message_id'],
+                session_id=row['session_id'],
+                agent_type=row['agent_type'],
+                content=row['content'],
+                timestamp=datetime.fromisoformat(row['timestamp']),
+                metadata=json.loads(row['metadata'])
+            ) for row in rows]
     
     def update_session_metadata(self, session_id: str, metadata_update: Dict[str, Any]):
         """Actualiza metadatos de sesión de forma incremental"""
@@ -233,27 +295,46 @@ class DatabaseManager:
     def add_message(self, session_id: str, agent_type: str, content: str, 
                    metadata: Optional[Dict] = None) -> str:
         """Agrega un mensaje a la conversación"""
-        message_id = str(uuid.uuid4())
-        now = datetime.now()
-        metadata = metadata or {}
+        with self.get_connection() as conn:
+            message_id = self._insert_message(conn, session_id, agent_type, content, metadata)
+            conn.commit()
         
+        return message_id
+    
+    def add_message_and_update_status(self, session_id: str, status: str, agent_type: str,
+                                      content: str, metadata: Optional[Dict] = None) -> str:
+        """Agrega un mensaje y cambia el estado de la sesión en una sola transacción"""
         with self.get_connection() as conn:
-            conn.execute("""
-                INSERT INTO messages 
-                (message_id, session_id, agent_type, content, timestamp, metadata)
-                VALUES (?, ?, ?, ?, ?, ?)
-            """, (message_id, session_id, agent_type, content, now, json.dumps(metadata)))
-            
-            # Actualizar timestamp de sesión
+            message_id = self._insert_message(conn, session_id, agent_type, content, metadata)
             conn.execute("""
                 UPDATE conversation_sessions 
-                SET updated_at = ? WHERE session_id = ?
-            """, (now, session_id))
-            
+                SET status = ? WHERE session_id = ?
+            """, (status, session_id))
             conn.commit()
         
         return message_id
     
+    def _insert_message(self, conn: sqlite3.Connection, session_id: str, agent_type: str,
+                        content: str, metadata: Optional[Dict]) -> str:
+        """Inserta un mensaje y actualiza el timestamp de la sesión (sin commit)"""
+        message_id = str(uuid.uuid4())
+        now = datetime.now()
+        metadata_json = _dumps_metadata(metadata) if metadata else "{}"
+        
+        conn.execute("""
+            INSERT INTO messages 
+            (message_id, session_id, agent_type, content, timestamp, metadata)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (message_id, session_id, agent_type, content, now, metadata_json))
+        
+        # Actualizar timestamp de sesión
+        conn.execute("""
+            UPDATE conversation_sessions 
+            SET updated_at = ? WHERE session_id = ?
+        """, (now, session_id))
+        
+        return message_id
+    
     def get_conversation_history(self, session_id: str, limit: Optional[int] = None) -> List[Message]:
         """Obtiene el historial de conversación"""
         query = """
@@ -279,6 +360,41 @@ class DatabaseManager:
                 metadata=json.loads(row['metadata'])
             ) for row in rows]
     
+    def count_client_messages(self, session_id: str, after_token: int = 0) -> int:
+        """Cuenta los mensajes del cliente en una sesión (posteriores al token) sin cargar el historial"""
+        with self.get_connection() as conn:
+            return conn.execute("""
+                SELECT COUNT(1) FROM messages
+                WHERE session_id = ? AND agent_type = 'user' AND rowid > ?
+            """, (session_id, after_token)).fetchone()[0]
+    
+    def get_client_message_token(self, session_id: str) -> int:
+        """
+        Token de cambios de los mensajes del cliente: el rowid más alto
+        
+        Es una búsqueda directa en idx_messages_session_agent; 0 si no hay mensajes.
+        """
+        with self.get_connection() as conn:
+            return conn.execute("""
+                SELECT COALESCE(MAX(rowid), 0) FROM messages
+                WHERE session_id = ? AND agent_type = 'user'
+            """, (session_id,)).fetchone()[0]
+    
+    def get_last_advisor_ts(self, session_id: str) -> Optional[datetime]:
+        """
+        Timestamp del último mensaje del asesor, o None si no hay
+        
+        Agregado de una fila resuelto en idx_messages_session_agent_ts; sirve de
+        sonda barata antes de pedir el delta con get_messages_since.
+        """
+        with self.get_connection() as conn:
+            last_ts = conn.execute("""
+                SELECT MAX(timestamp) FROM messages
+                WHERE session_id = ? AND agent_type = 'human_advisor'
+            """, (session_id,)).fetchone()[0]
+        
+        return datetime.fromisoformat(last_ts) if last_ts else None
+    
     def save_agent_state(self, session_id: str, agent_type: str, state_data: Dict):
         """Guarda el estado de un agente"""
         with self.get_connection() as conn:
@@ -301,6 +417,24 @@ class DatabaseManager:
                 return json.loads(row['state_data'])
         return None
     
+    def get_agent_state_token(self, session_id: str) -> Optional[str]:
+        """Token de cambios de los estados de agente: la última actualización de la sesión"""
+        with self.get_connection() as conn:
+            return conn.execute("""
+                SELECT MAX(updated_at) FROM agent_state WHERE session_id = ?
+            """, (session_id,)).fetchone()[0]
+    
+    def get_agent_states(self, session_id: str, agent_types: List[str]) -> Dict[str, Dict]:
+        """Obtiene el estado de varios agentes en una sola consulta"""
+        placeholders = ", ".join("?" for _ in agent_types)
+        with self.get_connection() as conn:
+            rows = conn.execute(f"""
+                SELECT agent_type, state_data FROM agent_state
+                WHERE session_id = ? AND agent_type IN ({placeholders})
+            """, (session_id, *agent_types)).fetchall()
+            
+            return {row['agent_type']: json.loads(row['state_data']) for row in rows}
+    
     def save_quotation(self, session_id: str, vehicle_data: Dict, 
                       quotation_result: Dict) -> str:
         """Guarda una cotización"""
@@ -317,6 +451,17 @@ class DatabaseManager:
         
         return quotation_id
     
+    def get_quotation(self, quotation_id: str) -> Optional[Dict]:
+        """Obtiene el resultado completo de una cotización"""
+        with self.get_connection() as conn:
+            row = conn.execute("""
+                SELECT quotation_result FROM quotations WHERE quotation_id = ?
+            """, (quotation_id,)).fetchone()
+            
+            if row:
+                return json.loads(row['quotation_result'])
+        return None
+    
     def save_policy(self, policy_number: str, session_id: str, 
                    quotation_id: Optional[str], client_data: Dict, 
                    policy_data: Dict):
@@ -6,6 +6,13 @@ Componentes visuales modernos que se integran con Streamlit sin afectar funciona
 import streamlit as st
 import streamlit.components.v1 as components
 from datetime import datetime
+from functools import lru_cache
+
+try:
+    from ciso8601 import parse_datetime as _parse_iso  # Parser ISO-8601 en C (opcional)
+except ImportError:
+    def _parse_iso(value: str) -> datetime:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
 
 
 def apply_sura_theme():
@@ -742,6 +749,11 @@ def render_modern_alert(message: str, alert_type: str = "info"):
 
 def render_chat_message(content: str, sender: str = "assistant", timestamp: str = None):
     """Renderiza mensaje de chat con diseño corporativo profesional"""
+    st.markdown(build_chat_message_html(content, sender, timestamp), unsafe_allow_html=True)
+
+
+def build_chat_message_html(content: str, sender: str = "assistant", timestamp: str = None) -> str:
+    """HTML de un mensaje de chat; sin sangría para poder concatenar varios en un solo st.markdown"""
     
     if timestamp is None:
         timestamp = datetime.now().strftime("%H:%M")
@@ -755,22 +767,30 @@ def render_chat_message(content: str, sender: str = "assistant", timestamp: str
         icon = '<span class="message-icon assistant-icon">■</span>'
         sender_label = "Seguros Sura"
     
-    message_html = f"""
-    <div class="chat-message-container {sender}">
-        <div class="message-wrapper">
-            <div class="message-header">
-                {icon}
-                <span class="sender-name">{sender_label}</span>
-                <span class="message-time">{timestamp}</span>
-            </div>
-            <div class="message-content-professional">
-                {content}
-            </div>
-        </div>
-    </div>
-    """
-    
-    st.markdown(message_html, unsafe_allow_html=True)
+    # Las líneas indentadas se interpretarían como bloque de código al concatenar
+    return "\n".join((
+        f'<div class="chat-message-container {sender}">',
+        '<div class="message-wrapper">',
+        '<div class="message-header">',
+        icon,
+        f'<span class="sender-name">{sender_label}</span>',
+        f'<span class="message-time">{timestamp}</span>',
+        '</div>',
+        '<div class="message-content-professional">',
+        content,
+        '</div>',
+        '</div>',
+        '</div>'
+    ))
+
+
+@lru_cache(maxsize=4096)
+def format_datetime_display(datetime_str: str, fmt: str = "%d/%m/%Y %H:%M") -> str:
+    """Formatea un timestamp ISO para display (memoizado: se repite en cada rerun)"""
+    try:
+        return _parse_iso(datetime_str).strftime(fmt)
+    except Exception:
+        return datetime_str
 
 
 def render_loading_spinner(text: str = "Procesando..."):